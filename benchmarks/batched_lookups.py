@@ -0,0 +1,90 @@
+"""
+get_first_or_none in a loop against get_first_or_none_many, with and
+without the identity map.
+
+    python benchmarks/batched_lookups.py [--users 10000] [--lookups 1000]
+                                         [--distinct 250] [--settings ...] [--runs 3]
+
+Creates --users users, then looks up --lookups usernames drawn from
+--distinct of them (so a view looking the same users up again and again):
+
+    loop                get_first_or_none per username, a query each
+    many                get_first_or_none_many, a query per batch
+    loop, identity map  get_first_or_none inside start_identity_map(), so
+                        each distinct user is queried once
+    many, identity map  get_first_or_none_many twice in one "request"; the
+                        second call never touches the db
+
+Reports lookups/s and the queries each made, and checks they all find the
+same users.
+"""
+import random
+
+from common import argument_parser, print_table, rate, setup_django, timed
+
+
+def main():
+    parser = argument_parser(__doc__, settings=True)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--distinct', type=int, default=250)
+    args = parser.parse_args()
+    setup_django(args.settings)
+
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from djunk_drawer.db import (
+        clear_identity_map, get_first_or_none, get_first_or_none_many, start_identity_map)
+
+    prefix = 'bench-lookup-'
+    User.objects.filter(username__startswith=prefix).delete()
+    User.objects.bulk_create([User(username='{0}{1}'.format(prefix, i)) for i in range(args.users)])
+    rng = random.Random(0)
+    names = ['{0}{1}'.format(prefix, i) for i in rng.sample(range(args.users), min(args.distinct, args.users))]
+    # a few that don't exist, which come back as None
+    names += ['{0}missing-{1}'.format(prefix, i) for i in range(max(1, len(names) // 50))]
+    kwargs_list = [{'username': rng.choice(names)} for _ in range(args.lookups)]
+
+    def loop():
+        return [get_first_or_none(User, **kwargs) for kwargs in kwargs_list]
+
+    def many():
+        return get_first_or_none_many(User, kwargs_list)
+
+    def in_request(func, calls=1):
+        def request():
+            start_identity_map()
+            try:
+                for _ in range(calls):
+                    result = func()
+                return result
+            finally:
+                clear_identity_map()
+        return request
+
+    methods = (
+        ('loop', loop, 1),
+        ('many', many, 1),
+        ('loop, identity map', in_request(loop), 1),
+        ('many, identity map', in_request(many, 2), 2),
+        )
+    rows = []
+    expected = None
+    for name, func, calls in methods:
+        seconds, result = timed(func, args.runs)
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        found = [obj and obj.pk for obj in result]
+        if expected is None:
+            expected = found
+        rows.append((name, rate(calls * len(kwargs_list), seconds), len(queries), found == expected))
+
+    User.objects.filter(username__startswith=prefix).delete()
+    print_table(('method', 'lookups/s', 'queries', 'same users'), rows, args.json)
+    if not all(row[-1] for row in rows):
+        raise AssertionError('Methods found different users')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+utils.find_key on a plain dict against a BiDict.
+
+    python benchmarks/bidict.py [--sizes 1000 100000] [--lookups 1000] [--runs 3]
+
+For each size, times building the mapping, looking up keys by value
+with find_key (which inverts a plain dict on every call, so plain dict
+lookups are capped to keep big sizes quick) and with BiDict.key_for,
+and reassigning values (which keeps the reverse index in step). Reports
+the memory each mapping takes where tracemalloc is available (py3), and
+checks both give the same keys. No django needed.
+"""
+import random
+
+from common import argument_parser, print_table, rate, timed
+
+from djunk_drawer.utils import BiDict, find_key
+
+# find_key on a plain dict is O(n) a call; cap the calls at this many key-values
+PLAIN_LOOKUP_BUDGET = 10 ** 7
+
+
+def make_items(size):
+    "size (code, name) pairs with unique names, like a big choices map"
+    return [('C{0:06d}'.format(i), 'Name {0}'.format(i)) for i in range(size)]
+
+
+def allocated(build):
+    "Bytes allocated by build()'s result (None without tracemalloc)"
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        items = make_items(size)
+        rng = random.Random(size)
+        values = [rng.choice(items)[1] for _ in range(args.lookups)]
+        plain_values = values[:max(1, min(len(values), PLAIN_LOOKUP_BUDGET // size))]
+        plain, bidict = dict(items), BiDict(items)
+
+        seconds, _ = timed(lambda: dict(items), args.runs)
+        bi_seconds, _ = timed(lambda: BiDict(items), args.runs)
+        rows.append((size, 'build /s', rate(size, seconds), rate(size, bi_seconds), True))
+
+        seconds, expected = timed(lambda: [find_key(plain, v) for v in plain_values], args.runs)
+        bi_seconds, found = timed(lambda: [find_key(bidict, v) for v in values], args.runs)
+        rows.append((size, 'find_key /s', rate(len(plain_values), seconds), rate(len(values), bi_seconds),
+                     found[:len(plain_values)] == expected))
+
+        bi_seconds, found = timed(lambda: [bidict.key_for(v) for v in values], args.runs)
+        rows.append((size, 'key_for /s', '-', rate(len(values), bi_seconds),
+                     found[:len(plain_values)] == expected))
+
+        def reassign(mapping):
+            for key, value in items[:args.lookups]:
+                mapping[key] = value + ' (renamed)'
+                mapping[key] = value
+        seconds, _ = timed(lambda: reassign(plain), args.runs)
+        bi_seconds, _ = timed(lambda: reassign(bidict), args.runs)
+        rows.append((size, 'reassign /s', rate(2 * args.lookups, seconds), rate(2 * args.lookups, bi_seconds),
+                     dict(bidict) == plain and bidict.key_for(items[0][1]) == items[0][0]))
+
+        rows.append((size, 'memory bytes', allocated(lambda: dict(items)),
+                     allocated(lambda: BiDict(items)), True))
+
+    print_table(('entries', 'operation', 'dict', 'BiDict', 'same'), rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
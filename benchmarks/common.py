@@ -0,0 +1,98 @@
+"""
+Bits shared by the benchmarks: putting djunk_drawer on the path, setting
+django up, timing, and printing results.
+
+Benchmarks that need django use DJANGO_SETTINGS_MODULE (or --settings)
+if given, else a minimal in-memory settings module (sqlite, locmem cache,
+djunk_drawer installed), like startup.py.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def argument_parser(doc, settings=False):
+    "An ArgumentParser with the --runs and --json (and --settings) every benchmark takes"
+    parser = argparse.ArgumentParser(description=doc.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3, help='Runs per measurement (best is shown)')
+    parser.add_argument('--json', action='store_true', help='Print results as json')
+    if settings:
+        parser.add_argument('--settings', help='DJANGO_SETTINGS_MODULE to use')
+    return parser
+
+
+def setup_django(settings_module=None, **overrides):
+    """
+    django.setup() with settings_module (or DJANGO_SETTINGS_MODULE), else
+    minimal in-memory settings updated with overrides. Creates the tables
+    of installed apps in the in-memory db.
+    """
+    if settings_module:
+        os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    in_memory = not os.environ.get('DJANGO_SETTINGS_MODULE')
+    if in_memory:
+        from django.conf import settings
+        options = dict(
+            DEBUG=False,
+            SECRET_KEY='benchmark',
+            ROOT_URLCONF=None,
+            USE_TZ=True,
+            DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes', 'djunk_drawer'],
+            TEMPLATES=[{'BACKEND': 'django.template.backends.django.DjangoTemplates',
+                        'APP_DIRS': True}],
+            )
+        options.update(overrides)
+        settings.configure(**options)
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
+    if in_memory:
+        from django.core.management import call_command
+        call_command('migrate' if django.VERSION >= (1, 7) else 'syncdb', verbosity=0, interactive=False)
+
+
+def timed(func, runs=3, setup=None):
+    """
+    (best wall time in seconds of runs calls to func(), the last call's
+    result). setup(), if given, is called before each run, untimed.
+    """
+    best = None
+    for _ in range(runs):
+        if setup is not None:
+            setup()
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def rate(count, seconds):
+    "count per second, for things done in seconds"
+    return count / seconds if seconds else float('inf')
+
+
+def print_table(headers, rows, as_json=False):
+    "Print rows (tuples, one value per header) as a table, or a json list of dicts"
+    if as_json:
+        print(json.dumps([dict(zip(headers, row)) for row in rows], indent=2, default=str))
+        return
+    cells = [[format_cell(value) for value in row] for row in rows]
+    widths = [max([len(header)] + [len(row[i]) for row in cells]) for i, header in enumerate(headers)]
+    print('  '.join(header.rjust(width) for header, width in zip(headers, widths)))
+    for row in cells:
+        print('  '.join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def format_cell(value):
+    if isinstance(value, float):
+        return '{0:,.2f}'.format(value) if value < 100 else '{0:,.0f}'.format(value)
+    return str(value)
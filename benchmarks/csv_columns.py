@@ -0,0 +1,97 @@
+"""
+generate_csv_columns (column chunks, typed) against generate_csv_rows.
+
+    python benchmarks/csv_columns.py [--mb 50] [--chunk-size 10000] [--runs 3]
+
+Writes a csv of about --mb megabytes (see csv_parallel.py) and reads it
+with each reader, converting Id to int, Amount to Decimal and Date to a
+date, and totalling Amount:
+
+    rows      generate_csv_rows, converting each Row by hand
+    columns   generate_csv_columns with types, list columns
+    arrays    the same with arrays=True (only if numpy is installed)
+
+Reports rows/s, and peak memory traced while reading (py3's tracemalloc,
+in a separate untimed run since tracing slows everything down). Checks
+every reader counts the same rows and the same total. No django needed.
+"""
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+
+from common import argument_parser, print_table, rate, timed
+from csv_parallel import MB, write_csv
+
+from djunk_drawer.csv_utils import generate_csv_columns, generate_csv_rows, parse_date
+
+TYPES = {'Id': 'int', 'Amount': 'decimal', 'Date': 'date'}
+
+
+def read_rows(path, chunk_size):
+    count, total = 0, Decimal(0)
+    for row in generate_csv_rows(path):
+        int(row.Id), parse_date(row.Date)
+        total += Decimal(row.Amount)
+        count += 1
+    return count, total
+
+
+def read_columns(path, chunk_size, arrays=False):
+    count, total = 0, Decimal(0)
+    for chunk in generate_csv_columns(path, chunk_size, TYPES, arrays):
+        count += len(chunk['Id'])
+        total += sum(chunk['Amount'])
+    return count, total
+
+
+def peak_memory(func):
+    "Peak bytes traced while func() runs (None without tracemalloc)"
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--mb', type=int, default=50)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    readers = [('rows', read_rows), ('columns', read_columns)]
+    try:
+        import numpy  # noqa
+    except ImportError:
+        pass
+    else:
+        readers.append(('arrays', lambda path, chunk_size: read_columns(path, chunk_size, arrays=True)))
+
+    directory = tempfile.mkdtemp(prefix='csv-columns-bench-')
+    try:
+        path = os.path.join(directory, 'data.csv')
+        write_csv(path, args.mb * MB)
+        rows = []
+        results = []
+        for name, read in readers:
+            seconds, result = timed(lambda: read(path, args.chunk_size), args.runs)
+            results.append(result)
+            peak = peak_memory(lambda: read(path, args.chunk_size))
+            rows.append((name, result[0], rate(result[0], seconds),
+                         '-' if peak is None else peak / float(MB)))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if any(result != results[0] for result in results):
+        raise AssertionError('Readers disagree: {0!r}'.format(results))
+    print_table(('reader', 'rows', 'rows/s', 'peak MB'), rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
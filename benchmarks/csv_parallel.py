@@ -0,0 +1,119 @@
+"""
+generate_csv_rows_parallel against generate_csv_rows on big synthetic files.
+
+    python benchmarks/csv_parallel.py [--sizes-mb 100 500 2000] [--processes 1 2 4 8]
+                                      [--dir DIR] [--keep] [--runs 1]
+
+Writes a csv of each size (ids, names, amounts, dates, and a notes column
+with quoted commas, quotes and newlines in some rows) to --dir (default
+a temp dir, removed afterwards unless --keep), then reads it all with
+generate_csv_rows and with generate_csv_rows_parallel at each process
+count, reporting rows/s and MB/s. Files are written with CRLF line
+endings, and before timing anything each reader's rows are checked
+against generate_csv_rows on a small LF, CRLF and CR file.
+No django needed.
+"""
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+
+from common import argument_parser, print_table, rate, timed
+
+from djunk_drawer.csv_utils import generate_csv_rows, generate_csv_rows_parallel
+
+MB = 1024 * 1024
+HEADER = 'Id,Name,Amount,Date,Notes'
+NOTES = ['', 'plain', '"with, comma"', '"said ""hi"""', '"two{newline}lines"']
+
+
+def make_block(newline, size=4 * MB, seed=0):
+    "About size bytes of csv rows (no header), ending in a newline"
+    rng = random.Random(seed)
+    rows = []
+    length = 0
+    while length < size:
+        row = '{0},name {1},{2:.2f},{3:02d}/{4:02d}/20{5:02d},{6}'.format(
+            len(rows), rng.randrange(10000), rng.uniform(-1000, 1000),
+            rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 30),
+            rng.choice(NOTES).format(newline=newline))
+        rows.append(row)
+        length += len(row) + len(newline)
+    return (newline.join(rows) + newline).encode('utf-8')
+
+
+def write_csv(path, size, newline='\r\n'):
+    "Write a csv of at least size bytes to path"
+    block = make_block(newline, min(size, 4 * MB))
+    with open(path, 'wb') as f:
+        f.write((HEADER + newline).encode('utf-8'))
+        written = 0
+        while written < size:
+            f.write(block)
+            written += len(block)
+
+
+def check_equivalent(directory, processes):
+    "Both readers give the same rows for LF, CRLF and CR files, at several chunk sizes"
+    path = os.path.join(directory, 'check.csv')
+    for newline in ('\n', '\r\n', '\r'):
+        with open(path, 'wb') as f:
+            f.write((HEADER + newline).encode('utf-8') + make_block(newline, 64 * 1024))
+        expected = list(generate_csv_rows(path))
+        for chunk_bytes in (100, 4096, 16 * MB):
+            rows = list(generate_csv_rows_parallel(path, max(processes), chunk_bytes))
+            if rows != expected:
+                raise AssertionError('Rows differ with {0!r} newlines, chunk_bytes={1}'.format(
+                    newline, chunk_bytes))
+    os.remove(path)
+
+
+def count(rows):
+    n = 0
+    for _ in rows:
+        n += 1
+    return n
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--sizes-mb', type=int, nargs='+', default=[100, 500, 2000])
+    parser.add_argument('--processes', type=int, nargs='+',
+                        default=sorted(set([1, 2, 4, multiprocessing.cpu_count()])))
+    parser.add_argument('--dir', help='Where to write the csv files (default a temp dir)')
+    parser.add_argument('--keep', action='store_true', help="Don't delete the csv files")
+    parser.set_defaults(runs=1)
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix='csv-bench-')
+    try:
+        check_equivalent(directory, args.processes)
+        rows = []
+        for size_mb in args.sizes_mb:
+            path = os.path.join(directory, '{0}mb.csv'.format(size_mb))
+            if not os.path.exists(path):
+                write_csv(path, size_mb * MB)
+            mb = os.path.getsize(path) / float(MB)
+
+            seconds, n = timed(lambda: count(generate_csv_rows(path)), args.runs)
+            rows.append((size_mb, 'generate_csv_rows', '-', rate(n, seconds), rate(mb, seconds), 1.0))
+            single = seconds
+            for processes in args.processes:
+                seconds, parallel_n = timed(
+                    lambda: count(generate_csv_rows_parallel(path, processes)), args.runs)
+                if parallel_n != n:
+                    raise AssertionError('{0} rows in parallel, {1} in series'.format(parallel_n, n))
+                rows.append((size_mb, 'parallel', processes, rate(n, seconds), rate(mb, seconds),
+                             single / seconds))
+            if not args.keep:
+                os.remove(path)
+    finally:
+        if not args.keep and not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print_table(('file MB', 'reader', 'processes', 'rows/s', 'MB/s', 'speedup'), rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
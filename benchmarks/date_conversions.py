@@ -0,0 +1,91 @@
+"""
+The bulk date conversions in djunk_drawer.dates against their scalar
+versions in a loop.
+
+    python benchmarks/date_conversions.py [--sizes 10000 100000 1000000] [--zone America/Chicago] [--runs 3]
+
+For each size, times converting that many utc timestamps spread over 40
+years (so plenty of DST transitions) to local datetimes, back to
+timestamps, and formatting them, one at a time and in bulk (and from a
+numpy datetime64 array, if numpy is installed). Checks both ways agree.
+
+The zone is a pytz zone if pytz is installed (the bulk functions use its
+transition table), else a zoneinfo one. django must be importable, but
+isn't set up.
+"""
+import random
+
+from common import argument_parser, print_table, rate, timed
+
+
+def get_zone(name):
+    try:
+        import pytz
+    except ImportError:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(name)
+    return pytz.timezone(name)
+
+
+def make_timestamps(size, seed=0):
+    "size utc timestamps between 1990 and 2030"
+    rng = random.Random(seed)
+    return [rng.randrange(631152000, 1893456000) for _ in range(size)]
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--zone', default='America/Chicago')
+    args = parser.parse_args()
+
+    from django.utils import timezone
+    from djunk_drawer.dates import (
+        datetime_to_timestamp, datetimes_to_timestamps, format_local_datetime,
+        format_local_datetimes, timestamp_to_datetime, timestamps_to_datetimes)
+
+    tz = get_zone(args.zone)
+    timezone.activate(tz)  # format_local_datetime formats in the current tz
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    rows = []
+    for size in args.sizes:
+        timestamps = make_timestamps(size)
+        dts = timestamps_to_datetimes(timestamps, tz)
+        operations = [
+            ('to datetimes',
+             lambda: [timestamp_to_datetime(ts, tz) for ts in timestamps],
+             lambda: timestamps_to_datetimes(timestamps, tz)),
+            ('to timestamps',
+             lambda: [datetime_to_timestamp(dt) for dt in dts],
+             lambda: datetimes_to_timestamps(dts)),
+            ('format',
+             lambda: [format_local_datetime(dt) for dt in dts],
+             lambda: format_local_datetimes(dts, tz=tz)),
+            ]
+        if numpy is not None:
+            array = numpy.array(timestamps, dtype='datetime64[s]')
+            operations.append(('datetime64 to datetimes',
+                               lambda: [timestamp_to_datetime(ts, tz) for ts in timestamps],
+                               lambda: timestamps_to_datetimes(array, tz)))
+
+        for name, scalar, bulk in operations:
+            scalar_seconds, expected = timed(scalar, args.runs)
+            bulk_seconds, result = timed(bulk, args.runs)
+            # same instants, and the same local wall times and offsets
+            if name.endswith('datetimes'):
+                same = [(d, d.replace(tzinfo=None), d.utcoffset()) for d in result] == \
+                       [(d, d.replace(tzinfo=None), d.utcoffset()) for d in expected]
+            else:
+                same = result == expected
+            rows.append((size, name, rate(size, scalar_seconds), rate(size, bulk_seconds),
+                         scalar_seconds / bulk_seconds if bulk_seconds else float('inf'), same))
+
+    print_table(('values', 'conversion', 'scalar /s', 'bulk /s', 'speedup', 'same'), rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
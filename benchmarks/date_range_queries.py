@@ -0,0 +1,121 @@
+"""
+Counting rows in a wide date range: one range query, bucketed queries in
+threads (map_date_range), and one GROUP BY (count_by_period).
+
+    python benchmarks/date_range_queries.py [--rows 1000000] [--db events.sqlite3]
+                                            [--workers 4] [--granularity month] [--runs 3]
+
+Fills a table of --rows events with indexed `created` datetimes spread
+over three years (in a sqlite file, kept between runs if --db is given;
+or in the --settings database, i.e. postgres), then counts the events in
+the middle two years:
+
+    single range     filter(created__gte=.., created__lte=..).count(), what
+                     DateRangeWidget.date_range_filter gives
+    bucket by bucket a count() per --granularity bucket, one after another
+    map_date_range   the same bucket counts, --workers at a time in threads
+    count_by_period  every bucket's count in one GROUP BY query
+
+and checks they all agree.
+"""
+import os
+import random
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+from common import argument_parser, print_table, setup_django, timed
+
+TIME_ZONE = 'America/Chicago'
+
+
+def define_model():
+    from django.db import models
+
+    class Event(models.Model):
+        created = models.DateTimeField(db_index=True)
+        amount = models.IntegerField()
+
+        class Meta:
+            app_label = 'djunk_drawer'
+            db_table = 'djunk_drawer_benchmark_event'
+    return Event
+
+
+def fill(model, rows, start, seconds, batch_size=10000, seed=0):
+    "Create the model's table if need be, and fill it with rows events from start"
+    from django.db import connection, transaction
+    if model._meta.db_table not in connection.introspection.table_names():
+        with connection.schema_editor() as editor:
+            editor.create_model(model)
+    if model.objects.count() == rows:
+        return
+    model.objects.all().delete()
+    rng = random.Random(seed)
+    for offset in range(0, rows, batch_size):
+        with transaction.atomic():
+            model.objects.bulk_create([
+                model(created=start + timedelta(seconds=rng.randrange(seconds)), amount=rng.randrange(100))
+                for _ in range(min(batch_size, rows - offset))])
+
+
+def main():
+    parser = argument_parser(__doc__, settings=True)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--db', help='sqlite file to keep the table in (default a temp file)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--granularity', default='month')
+    args = parser.parse_args()
+
+    # a file, not :memory:, so map_date_range's threads see the same db
+    directory = None if args.db else tempfile.mkdtemp(prefix='date-range-bench-')
+    path = args.db or os.path.join(directory, 'events.sqlite3')
+    try:
+        setup_django(args.settings, TIME_ZONE=TIME_ZONE,
+                     DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}})
+        run(args)
+    finally:
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def run(args):
+    from django.utils import timezone
+    from djunk_drawer.db import count_by_period, date_range_bucket_filters, map_date_range
+
+    Event = define_model()
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime(2020, 1, 1), tz)
+    fill(Event, args.rows, start, 3 * 365 * 86400)
+
+    dates = (timezone.make_aware(datetime(2020, 7, 1), tz),
+             timezone.make_aware(datetime(2022, 6, 30, 23, 59, 59), tz))
+    queryset = Event.objects.all()
+    # what DateRangeWidget.date_range_filter(dates, 'created') returns
+    range_filter = {'created__gte': dates[0], 'created__lte': dates[1]}
+    buckets = date_range_bucket_filters(dates, 'created', args.granularity)
+
+    methods = (
+        ('single range', lambda: queryset.filter(**range_filter).count()),
+        ('bucket by bucket', lambda: [queryset.filter(**f).count() for f in buckets]),
+        ('map_date_range', lambda: map_date_range(queryset, dates, 'created', lambda qs: qs.count(),
+                                                  args.granularity, args.workers)),
+        ('count_by_period', lambda: [n for period, n in count_by_period(
+            queryset.filter(**range_filter), 'created', args.granularity)]),
+        )
+    results = []
+    rows = []
+    for name, count in methods:
+        seconds, result = timed(count, args.runs)
+        results.append(result)
+        total = result if isinstance(result, int) else sum(result)
+        rows.append((name, len(buckets) if name != 'single range' else 1, total, seconds * 1000))
+
+    single, by_bucket, mapped, grouped = results
+    if not (single == sum(by_bucket) and by_bucket == mapped and [n for n in by_bucket if n] == grouped):
+        raise AssertionError('Counts differ: {0!r}'.format(results))
+    print_table(('method', 'buckets', 'rows counted', 'ms'), rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
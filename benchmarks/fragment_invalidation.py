@@ -0,0 +1,84 @@
+"""
+Invalidating cached template fragments: one delete per key, delete_many,
+and a fragment family's generation.
+
+    python benchmarks/fragment_invalidation.py [--counts 100 1000 10000] [--runs 3]
+
+For each count of cached per-user fragments, times invalidating them all
+with invalidate_template_cache in a loop (one cache round trip each),
+invalidate_template_cache_many (one delete_many) and
+invalidate_fragment_family (one incr, however many there are), and
+counts the cache calls each made. Uses a local in-memory (locmem) cache
+unless --settings points at something else.
+"""
+from common import argument_parser, print_table, rate, setup_django, timed
+
+FRAGMENT = 'user_links'
+CACHE_METHODS = ('get', 'set', 'add', 'delete', 'get_many', 'set_many', 'delete_many', 'incr')
+
+
+class CountingCache(object):
+    "Passes everything through to cache, counting calls to CACHE_METHODS"
+    def __init__(self, cache):
+        self.cache = cache
+        self.calls = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.cache, name)
+        if name not in CACHE_METHODS:
+            return attr
+
+        def counted(*args, **kwargs):
+            self.calls += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+def main():
+    parser = argument_parser(__doc__, settings=True)
+    parser.add_argument('--counts', type=int, nargs='+', default=[100, 1000, 10000])
+    args = parser.parse_args()
+    setup_django(args.settings)
+
+    from django.core.cache import cache
+    from djunk_drawer import template
+    from djunk_drawer.template import (
+        get_fragment_generation, invalidate_fragment_family, invalidate_template_cache,
+        invalidate_template_cache_many, template_cache_key)
+
+    counting = template.cache = CountingCache(cache)
+
+    def filler(count, family=False):
+        "Cache count fragments, keyed on the family's generation if family"
+        def fill():
+            extra = (get_fragment_generation(FRAGMENT), ) if family else ()
+            cache.set_many(dict((template_cache_key(FRAGMENT, pk, *extra), u'<a>{0}</a>'.format(pk))
+                                for pk in range(count)), 600)
+            counting.calls = 0
+        return fill
+
+    def check(count, family=False):
+        "Every fragment is gone, or, for a family, unreachable under the new generation"
+        extra = (get_fragment_generation(FRAGMENT), ) if family else ()
+        keys = [template_cache_key(FRAGMENT, pk, *extra) for pk in range(count)]
+        return not cache.get_many(keys)
+
+    rows = []
+    for count in args.counts:
+        methods = (
+            ('one by one', lambda: [invalidate_template_cache(FRAGMENT, pk) for pk in range(count)], False),
+            ('delete_many', lambda: invalidate_template_cache_many([(FRAGMENT, pk) for pk in range(count)]),
+             False),
+            ('family generation', lambda: invalidate_fragment_family(FRAGMENT), True),
+            )
+        for name, invalidate, family in methods:
+            seconds, _ = timed(invalidate, args.runs, filler(count, family))
+            rows.append((count, name, counting.calls, seconds * 1000, rate(count, seconds),
+                         check(count, family)))
+
+    print_table(('fragments', 'method', 'cache calls', 'ms', 'fragments/s', 'invalidated'),
+                rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
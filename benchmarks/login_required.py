@@ -0,0 +1,94 @@
+"""
+RequireLoginMiddleware's path matching, one pattern at a time vs combined.
+
+    python benchmarks/login_required.py [--counts 10 100 1000] [--paths 20000] [--runs 3]
+
+For each count of LOGIN_REQUIRED_URLS (with as many exceptions), times
+deciding whether --paths request paths need a login:
+
+    loop      every precompiled pattern tried in turn, the old way
+    combined  compile_any's combined regexes, no cache
+    cached    RequireLoginMiddleware.requires_login: combined regexes plus
+              the LRU cache of decisions, starting empty
+
+Paths repeat the way they do on a real site (most hits on a few pages),
+and the three must give the same decisions.
+"""
+import random
+
+from common import argument_parser, print_table, rate, setup_django, timed
+
+
+def make_patterns(count):
+    "(required, exceptions) pattern lists of count patterns each"
+    required = [r'^/section{0}/(.*)$'.format(i) for i in range(count)]
+    exceptions = [r'^/section{0}/(login|logout)(.*)$'.format(i) for i in range(count)]
+    return required, exceptions
+
+
+def make_paths(count, size, seed=0):
+    "size paths, 80% of them from the 50 most popular"
+    rng = random.Random(seed)
+    distinct = []
+    for i in range(1000):
+        section = rng.randrange(count * 2)  # half of them in no section
+        page = rng.choice(['login', 'logout', 'account', 'item/{0}'.format(i)])
+        distinct.append('/section{0}/{1}'.format(section, page))
+    popular = distinct[:50]
+    return [rng.choice(popular) if rng.random() < 0.8 else rng.choice(distinct) for _ in range(size)]
+
+
+def loop_decisions(required, exceptions, paths):
+    "The old way: try each exception, then each required pattern"
+    def requires_login(path):
+        for url in exceptions:
+            if url.match(path):
+                return False
+        for url in required:
+            if url.match(path):
+                return True
+        return False
+    return [requires_login(path) for path in paths]
+
+
+def main():
+    parser = argument_parser(__doc__, settings=True)
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--paths', type=int, default=20000)
+    args = parser.parse_args()
+    setup_django(args.settings)
+
+    import re
+    from django.test.utils import override_settings
+    from djunk_drawer.middleware import RequireLoginMiddleware, compile_any, match_any
+
+    rows = []
+    for count in args.counts:
+        required, exceptions = make_patterns(count)
+        paths = make_paths(count, args.paths)
+
+        old_required = [re.compile(p) for p in required]
+        old_exceptions = [re.compile(p) for p in exceptions]
+        loop_seconds, expected = timed(
+            lambda: loop_decisions(old_required, old_exceptions, paths), args.runs)
+
+        combined_required, combined_exceptions = compile_any(required), compile_any(exceptions)
+        combined_seconds, combined = timed(
+            lambda: [not match_any(combined_exceptions, path) and match_any(combined_required, path)
+                     for path in paths], args.runs)
+
+        with override_settings(LOGIN_REQUIRED_URLS=required, LOGIN_REQUIRED_URLS_EXCEPTIONS=exceptions):
+            def cached_decisions():
+                middleware = RequireLoginMiddleware()
+                return [middleware.requires_login(path) for path in paths]
+            cached_seconds, cached = timed(cached_decisions, args.runs)
+
+        rows.append((count, rate(len(paths), loop_seconds), rate(len(paths), combined_seconds),
+                     rate(len(paths), cached_seconds), combined == expected and cached == expected))
+
+    print_table(('patterns', 'loop paths/s', 'combined paths/s', 'cached paths/s', 'agree'),
+                rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
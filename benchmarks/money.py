@@ -0,0 +1,90 @@
+"""
+Throughput of djunk_drawer.money against make_decimal in a loop.
+
+    python benchmarks/money.py [--sizes 10000 100000 1000000] [--runs 3]
+
+For each size, times converting that many amounts in, summing them,
+multiplying by a rate, rounding to whole units and allocating a total
+over that many ratios, both ways, and checks both ways give the same
+answers. No django needed.
+"""
+import random
+from decimal import Decimal
+
+from common import argument_parser, print_table, rate, timed
+
+from djunk_drawer.money import FixedPointArray, allocate
+from djunk_drawer.utils import make_decimal
+
+RATE = '1.0725'
+
+
+def make_amounts(size, seed=0):
+    "size amounts as strings with 2 places, about half negative"
+    rng = random.Random(seed)
+    return ['{0:.2f}'.format(rng.uniform(-10000, 10000)) for _ in range(size)]
+
+
+def decimal_ops(amounts):
+    "Each operation done with make_decimal, one amount at a time"
+    rate_ = Decimal(RATE)
+    return [
+        ('convert', lambda: [make_decimal(a) for a in amounts]),
+        ('sum', lambda: sum(make_decimal(a) for a in amounts)),
+        ('multiply', lambda: [make_decimal(make_decimal(a) * rate_) for a in amounts]),
+        ('round', lambda: [make_decimal(make_decimal(a), 0) for a in amounts]),
+        ('allocate', lambda: allocate_decimal('1000000.00', [1] * len(amounts))),
+        ]
+
+
+def fixed_point_ops(amounts):
+    "The same operations with a FixedPointArray"
+    array = FixedPointArray(amounts)
+    return [
+        ('convert', lambda: FixedPointArray(amounts)),
+        ('sum', lambda: array.sum()),
+        ('multiply', lambda: array.multiply(RATE)),
+        ('round', lambda: array.round(0)),
+        ('allocate', lambda: allocate('1000000.00', [1] * len(amounts))),
+        ]
+
+
+def allocate_decimal(amount, ratios):
+    "allocate the obvious Decimal way: round each share, then fix up the last"
+    amount = make_decimal(amount)
+    total = sum(Decimal(r) for r in ratios)
+    parts = [make_decimal(amount * Decimal(r) / total) for r in ratios]
+    parts[-1] += amount - sum(parts)
+    return parts
+
+
+def as_decimals(result):
+    if isinstance(result, FixedPointArray):
+        return result.to_decimals()
+    return result
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        amounts = make_amounts(size)
+        for (name, decimal_op), (_, fixed_op) in zip(decimal_ops(amounts), fixed_point_ops(amounts)):
+            decimal_seconds, expected = timed(decimal_op, args.runs)
+            fixed_seconds, result = timed(fixed_op, args.runs)
+            if name == 'allocate':  # different leftover rules, same total
+                same = sum(as_decimals(result)) == sum(expected)
+            else:
+                same = as_decimals(result) == expected
+            rows.append((size, name, rate(size, decimal_seconds), rate(size, fixed_seconds),
+                         decimal_seconds / fixed_seconds if fixed_seconds else float('inf'), same))
+
+    print_table(('amounts', 'operation', 'make_decimal /s', 'FixedPointArray /s', 'speedup', 'same'),
+                rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
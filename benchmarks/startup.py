@@ -0,0 +1,146 @@
+"""
+How much each djunk_drawer module costs a worker at startup.
+
+    python benchmarks/startup.py [--settings myproject.settings] [--runs 5]
+
+Every measurement is taken in a fresh python process, so nothing is
+already imported. For each module it reports the median time to import
+it on top of django.setup(), the growth in peak RSS, and any of the
+heavy optional dependencies (markdown, dateutil, floppyforms, numpy,
+multiprocessing...) that importing it dragged in. Those should all be
+loaded lazily, on first use, so that column should stay empty (except
+floppyforms for widgets, whose classes subclass it).
+
+Then it times a worker cold start: a fresh process going from nothing
+to a ready WSGI application with every djunk_drawer module imported.
+
+Without --settings (or DJANGO_SETTINGS_MODULE), a minimal in-memory
+settings module with djunk_drawer installed is used.
+"""
+import argparse
+import json
+import os
+import pkgutil
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ('markdown', 'dateutil', 'floppyforms', 'numpy', 'multiprocessing',
+         'tablib', 'pytz', 'zstandard', 'lzma', 'cProfile')
+
+# Run in the child: set django up, then import `modules` and report on them
+CHILD = r'''
+import json, os, resource, sys, time
+sys.path.insert(0, {root!r})
+if not os.environ.get('DJANGO_SETTINGS_MODULE'):
+    from django.conf import settings
+    settings.configure(
+        DEBUG=False,
+        SECRET_KEY='benchmark',
+        ROOT_URLCONF=None,
+        DATABASES={{'default': {{'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}}}},
+        INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes', 'djunk_drawer'],
+        )
+
+def rss_kb():
+    # ru_maxrss is kb on linux, bytes on macs
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+start = time.time()
+import django
+if hasattr(django, 'setup'):
+    django.setup()
+setup_time = time.time() - start
+
+before_modules = set(sys.modules)
+before_rss = rss_kb()
+start = time.time()
+for module in {modules!r}:
+    __import__(module)
+if {wsgi!r}:
+    from django.core.wsgi import get_wsgi_application
+    get_wsgi_application()
+import_time = time.time() - start
+new = set(sys.modules) - before_modules
+print(json.dumps({{
+    'setup': setup_time,
+    'import': import_time,
+    'rss_kb': rss_kb() - before_rss,
+    'heavy': sorted(set(m.split('.')[0] for m in new) & set({heavy!r})),
+    }}))
+'''
+
+
+def djunk_modules():
+    "Every djunk_drawer module a worker might import (not tests), package first"
+    import djunk_drawer
+    names = ['djunk_drawer']
+    for _, name, _ in pkgutil.walk_packages(djunk_drawer.__path__, 'djunk_drawer.'):
+        if name != 'djunk_drawer.tests':
+            names.append(name)
+    return names
+
+
+def measure(modules, wsgi=False):
+    "Run a fresh interpreter importing modules; returns (wall seconds, its report)"
+    code = CHILD.format(root=ROOT, modules=list(modules), wsgi=wsgi, heavy=HEAVY)
+    start = time.time()
+    out = subprocess.check_output([sys.executable, '-c', code])
+    wall = time.time() - start
+    return wall, json.loads(out.decode('utf-8').strip().splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--settings', help='DJANGO_SETTINGS_MODULE to use')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per measurement (median is shown)')
+    parser.add_argument('--json', action='store_true', help='Print results as json')
+    args = parser.parse_args()
+    if args.settings:
+        os.environ['DJANGO_SETTINGS_MODULE'] = args.settings
+    sys.path.insert(0, ROOT)
+
+    results = {'modules': {}, 'cold_start': None}
+    for module in djunk_modules():
+        runs = [measure([module])[1] for _ in range(args.runs)]
+        results['modules'][module] = {
+            'import_ms': median([r['import'] for r in runs]) * 1000,
+            'rss_kb': median([r['rss_kb'] for r in runs]),
+            'heavy': runs[0]['heavy'],
+        }
+
+    cold = [measure(djunk_modules(), wsgi=True) for _ in range(args.runs)]
+    results['cold_start'] = {
+        'wall_ms': median([wall for wall, r in cold]) * 1000,
+        'setup_ms': median([r['setup'] for wall, r in cold]) * 1000,
+        'import_ms': median([r['import'] for wall, r in cold]) * 1000,
+        'rss_kb': median([r['rss_kb'] for wall, r in cold]),
+        'heavy': cold[0][1]['heavy'],
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return
+
+    print('{0:<50} {1:>10} {2:>10}  {3}'.format('module', 'import ms', 'rss kb', 'heavy deps loaded'))
+    for module, r in sorted(results['modules'].items(), key=lambda item: -item[1]['import_ms']):
+        print('{0:<50} {1:>10.1f} {2:>10}  {3}'.format(
+            module, r['import_ms'], r['rss_kb'], ', '.join(r['heavy'])))
+    c = results['cold_start']
+    print('')
+    print('cold start: {0:.0f} ms wall ({1:.0f} ms django.setup, {2:.0f} ms djunk_drawer + wsgi), '
+          '{3} kb rss'.format(c['wall_ms'], c['setup_ms'], c['import_ms'], c['rss_kb']))
+    if c['heavy']:
+        print('heavy deps loaded at startup: {0}'.format(', '.join(c['heavy'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Requests/sec for RobotsTxtView with and without cache_rendered.
+
+    python benchmarks/text_views.py [--requests 10000] [--runs 3]
+
+Serves a robots.txt template from a temp dir through RequestFactory
+requests:
+
+    rendered     RobotsTxtView, rendering the template every request
+    cached       cache_rendered=True, serving the bytes rendered once
+    cached 304   cache_rendered=True with If-None-Match: the ETag
+
+and checks the cached view serves the same text, answers the
+conditional request with a 304, and picks up edits to the template.
+Uses the in-memory settings.
+"""
+import os
+import shutil
+import tempfile
+
+from common import argument_parser, print_table, rate, setup_django, timed
+
+ROBOTS = u"""User-agent: *
+{% for path in disallowed %}Disallow: {{ path }}
+{% endfor %}Sitemap: http://example.com/sitemap.xml
+"""
+
+
+def reset_template_loaders():
+    "Empty the cached template loader (on by default when DEBUG is off, 1.11+)"
+    try:
+        from django.template import engines
+    except ImportError:
+        return
+    for engine in engines.all():
+        for loader in getattr(getattr(engine, 'engine', None), 'template_loaders', ()):
+            if hasattr(loader, 'reset'):
+                loader.reset()
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--requests', type=int, default=10000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='text-views-bench-')
+    try:
+        template_path = os.path.join(directory, 'robots.txt')
+        with open(template_path, 'w') as f:
+            f.write(ROBOTS)
+        setup_django(TEMPLATE_DIRS=[directory],
+                     TEMPLATES=[{'BACKEND': 'django.template.backends.django.DjangoTemplates',
+                                 'DIRS': [directory], 'APP_DIRS': True}])
+        run(args, template_path)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run(args, template_path):
+    from django.test.client import RequestFactory
+    from djunk_drawer.views import RobotsTxtView
+
+    class Robots(RobotsTxtView):
+        def get_context_data(self, **kwargs):
+            context = super(Robots, self).get_context_data(**kwargs)
+            context['disallowed'] = ['/admin/', '/accounts/', '/search/']
+            return context
+
+    rendered_view = Robots.as_view()
+    cached_view = Robots.as_view(cache_rendered=True)
+    factory = RequestFactory()
+
+    def serve(view, count, **headers):
+        for _ in range(count):
+            response = view(factory.get('/robots.txt', **headers))
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+    expected = serve(rendered_view, 1).content
+    etag = serve(cached_view, 1)['ETag']
+    checks = {
+        'same text': serve(cached_view, 1).content == expected,
+        '304': serve(cached_view, 1, HTTP_IF_NONE_MATCH=etag).status_code == 304,
+    }
+
+    rows = []
+    for name, view, headers in (('rendered', rendered_view, {}),
+                                ('cached', cached_view, {}),
+                                ('cached 304', cached_view, {'HTTP_IF_NONE_MATCH': etag})):
+        seconds, _ = timed(lambda: serve(view, args.requests, **headers), args.runs)
+        rows.append((name, rate(args.requests, seconds), seconds * 1000000 / args.requests))
+
+    # an edit (with a new mtime) is served, and changes the ETag
+    with open(template_path, 'a') as f:
+        f.write(u"Disallow: /new/\n")
+    mtime = os.path.getmtime(template_path) + 1
+    os.utime(template_path, (mtime, mtime))
+    reset_template_loaders()
+    response = serve(cached_view, 1)
+    checks['picks up edits'] = b'/new/' in response.content and response['ETag'] != etag
+
+    print_table(('view', 'requests/s', 'us/request'), rows, args.json)
+    failed = [name for name, ok in sorted(checks.items()) if not ok]
+    if failed:
+        raise AssertionError('Failed checks: {0}'.format(', '.join(failed)))
+
+
+if __name__ == '__main__':
+    main()
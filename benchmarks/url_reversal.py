@@ -0,0 +1,98 @@
+"""
+Rendering links with the linked_list and active_url_class filters, with
+and without url_cache.
+
+    python benchmarks/url_reversal.py [--counts 10 1000 10000] [--runs 3]
+
+For each count of objects, renders a page with a 20 item nav bar (one
+active_url_class each) and {{ objects|linked_list:"thing_detail" }}, and
+times the same links and nav classes built the old way, with a
+reverse() per object and per nav item. Checks both give the same html.
+Uses the in-memory settings and this file's own urlconf.
+"""
+from common import argument_parser, print_table, rate, setup_django, timed
+
+NAV_ITEMS = 20
+
+PAGE = (u'{% load djunk_filters %}'
+        u'<ul>{% for name in nav %}<li class="nav{{ request|active_url_class:name }}"></li>{% endfor %}</ul>'
+        u'<p>{{ objects|linked_list:"thing_detail" }}</p>')
+
+
+class Thing(object):
+    def __init__(self, pk):
+        self.pk = pk
+
+    def __str__(self):
+        return 'thing {0}'.format(self.pk)
+    __unicode__ = __str__
+
+
+class Request(object):
+    path = '/section3/things/'
+
+
+def view(request, *args):
+    pass
+
+
+def make_urlpatterns():
+    try:
+        from django.urls import re_path as url
+    except ImportError:  # Django < 2.0
+        from django.conf.urls import url
+    patterns = [url(r'^section{0}/$'.format(i), view, name='section{0}'.format(i))
+                for i in range(NAV_ITEMS)]
+    patterns.append(url(r'^things/(\d+)/$', view, name='thing_detail'))
+    return patterns
+
+
+def old_page(nav, objects, request):
+    "The page's html, reversing every url every time like the filters used to"
+    from django.utils.safestring import mark_safe
+    try:
+        from django.urls import reverse
+    except ImportError:  # Django < 1.10
+        from django.core.urlresolvers import reverse
+    items = []
+    for name in nav:
+        active = " active" if request.path.startswith(reverse(name)) else ""
+        items.append(u'<li class="nav{0}"></li>'.format(active))
+    links = [u"<a href='{0}'>{1}</a>".format(reverse('thing_detail', args=[obj.pk]), obj)
+             for obj in objects]
+    return mark_safe(u'<ul>{0}</ul><p>{1}</p>'.format(u''.join(items), u', '.join(links)))
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 1000, 10000])
+    args = parser.parse_args()
+    setup_django(ROOT_URLCONF='__main__')
+    urlpatterns.extend(make_urlpatterns())
+
+    from django.template import Context, Template
+    from djunk_drawer import url_cache
+
+    template = Template(PAGE)
+    nav = ['section{0}'.format(i) for i in range(NAV_ITEMS)]
+    request = Request()
+
+    rows = []
+    for count in args.counts:
+        objects = [Thing(pk) for pk in range(1, count + 1)]
+        old_seconds, expected = timed(lambda: old_page(nav, objects, request), args.runs)
+        cold_seconds, html = timed(lambda: template.render(Context(
+            {'nav': nav, 'objects': objects, 'request': request})), 1, url_cache._cache.clear)
+        seconds, html = timed(lambda: template.render(Context(
+            {'nav': nav, 'objects': objects, 'request': request})), args.runs)
+        rows.append((count, old_seconds * 1000, cold_seconds * 1000, seconds * 1000,
+                     rate(count, old_seconds), rate(count, seconds), html == expected))
+
+    print_table(('objects', 'reverse ms', 'cached cold ms', 'cached ms',
+                 'reverse links/s', 'cached links/s', 'same html'), rows, args.json)
+
+
+urlpatterns = []  # filled in by main, once django is set up
+
+if __name__ == '__main__':
+    main()
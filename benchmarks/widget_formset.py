@@ -0,0 +1,109 @@
+"""
+Rendering formsets that use all three widgets in djunk_drawer.widgets.
+
+    python benchmarks/widget_formset.py [--rows 10 100 500] [--runs 3]
+
+Each form has a USPhoneNumberMultiWidget, a DateRangeWidget and a
+BetterFileInput. For each number of rows, times rendering the whole
+formset, and each widget on its own once per row, with the widgets as
+they are and as they were (the file input's template loaded on every
+render, and the phone widget pushing is_required down to its inputs on
+every render). Checks both give the same html. Needs floppyforms.
+"""
+from datetime import datetime
+
+from common import argument_parser, print_table, rate, setup_django, timed
+
+
+class StoredFile(object):
+    "Enough of a FieldFile for BetterFileInput's template"
+    def __init__(self, name):
+        self.name = name
+        self.url = '/media/' + name
+
+    def __str__(self):
+        return self.name
+
+
+def make_widgets():
+    "{name: (current widget class, old widget class)}"
+    from django.template import Context, loader
+    from djunk_drawer.widgets import BetterFileInput, DateRangeWidget, USPhoneNumberMultiWidget
+
+    class OldPhoneWidget(USPhoneNumberMultiWidget):
+        def render(self, *args, **kwargs):
+            required = self.is_required
+            for widget in self.widgets:
+                widget.is_required = required
+            return super(OldPhoneWidget, self).render(*args, **kwargs)
+
+    class OldFileInput(BetterFileInput):
+        def render(self, name, value, attrs=None, renderer=None):
+            t = loader.get_template(self.template_name)
+            context = {'value': value, 'name': name, 'attrs': attrs}
+            if not hasattr(t, 'template'):
+                context = Context(context)
+            return t.render(context)
+
+    return {
+        'phone': (USPhoneNumberMultiWidget, OldPhoneWidget),
+        'dates': (DateRangeWidget, DateRangeWidget),
+        'attachment': (BetterFileInput, OldFileInput),
+    }
+
+
+def make_formset_class(widgets):
+    "A formset class whose forms use widgets, {field name: widget class}"
+    import floppyforms as forms
+    from django.forms.formsets import formset_factory
+    from djunk_drawer.widgets import ListFormField
+
+    class ContactForm(forms.Form):
+        phone = forms.CharField(widget=widgets['phone'](), required=False)
+        dates = ListFormField(widget=widgets['dates'](), required=False)
+        attachment = forms.FileField(widget=widgets['attachment'](), required=False)
+    return formset_factory(ContactForm, extra=0)
+
+
+def make_initial(rows):
+    from django.utils import timezone
+    tz = timezone.get_current_timezone()
+    return [{'phone': '555-123-{0:04d}'.format(i),
+             'dates': (timezone.make_aware(datetime(2015, 1, 1 + i % 28), tz),
+                       timezone.make_aware(datetime(2015, 2, 1 + i % 28), tz)),
+             'attachment': StoredFile('file{0}.pdf'.format(i)) if i % 2 else None}
+            for i in range(rows)]
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 100, 500])
+    args = parser.parse_args()
+    setup_django()
+
+    widgets = make_widgets()
+    current = make_formset_class(dict((name, pair[0]) for name, pair in widgets.items()))
+    old = make_formset_class(dict((name, pair[1]) for name, pair in widgets.items()))
+
+    rows = []
+    for count in args.rows:
+        initial = make_initial(count)
+        for name in sorted(widgets):
+            current_widget, old_widget = widgets[name][0](), widgets[name][1]()
+            values = [row[name] for row in initial]
+            attrs = {'id': 'id_' + name}
+            old_seconds, expected = timed(
+                lambda: [old_widget.render(name, v, attrs) for v in values], args.runs)
+            seconds, html = timed(
+                lambda: [current_widget.render(name, v, attrs) for v in values], args.runs)
+            rows.append((count, name, rate(count, old_seconds), rate(count, seconds), html == expected))
+
+        old_seconds, expected = timed(lambda: old(initial=initial).as_table(), args.runs)
+        seconds, html = timed(lambda: current(initial=initial).as_table(), args.runs)
+        rows.append((count, 'formset', rate(count, old_seconds), rate(count, seconds), html == expected))
+
+    print_table(('rows', 'rendering', 'old rows/s', 'current rows/s', 'same html'), rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
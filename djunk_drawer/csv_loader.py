@@ -0,0 +1,204 @@
+"""
+Load CSV files into models in batches instead of a save() per row.
+
+    loader = CSVModelLoader(Customer, key_fields=('code', ),
+                            field_map={'CustomerName': 'name'})
+    stats = loader.load_csv('customers.csv')
+
+Parsing runs in a background thread, feeding batches of rows through a
+queue to the calling thread, which does all the db writes (django db
+connections are per thread). So parsing the next batch overlaps with
+writing the last one.
+"""
+import sys
+import threading
+import time
+
+from django.db import transaction
+from django.db.models import Q
+
+try:
+    from Queue import Full, Queue
+except ImportError:
+    from queue import Full, Queue
+
+from djunk_drawer.csv_utils import generate_csv_rows
+
+atomic = getattr(transaction, 'atomic', None) or transaction.commit_on_success
+
+
+def simplify(name):
+    return name.replace('_', '').lower()
+
+
+class CSVModelLoader(object):
+    """
+    Maps CSV rows (as from csv_utils.generate_rows) to model instances.
+
+    field_map maps headers to field names. Headers not in it are matched
+    to fields ignoring case and underscores, so 'FirstName' fills
+    first_name. Unmatched headers are ignored.
+
+    With key_fields, rows whose key fields match an existing object update
+    it instead of creating a new one. Existing keys are read into memory
+    once up front rather than looked up row by row.
+
+    progress, if given, is called with the stats dict after each batch.
+    """
+    def __init__(self, model, field_map=None, key_fields=None, batch_size=500,
+                 using=None, progress=None):
+        self.model = model
+        self.field_map = field_map or {}
+        self.key_fields = tuple(key_fields or ())
+        self.batch_size = batch_size
+        self.using = using
+        self.progress = progress
+        self.manager = model._default_manager.db_manager(using)
+
+    def get_columns(self, headers):
+        "List of (index in row, model field) for headers we can load"
+        fields = dict((simplify(f.name), f) for f in self.model._meta.fields)
+        by_name = dict((f.name, f) for f in self.model._meta.fields)
+        columns = []
+        for i, header in enumerate(headers):
+            if header in self.field_map:
+                columns.append((i, by_name[self.field_map[header]]))
+            elif simplify(header) in fields:
+                columns.append((i, fields[simplify(header)]))
+        return columns
+
+    def convert(self, field, value):
+        "CSV string to python value for field. Blanks are None for nullable fields."
+        if value == '' and field.null:
+            return None
+        return field.to_python(value)
+
+    def parse(self, rows, queue, stop):
+        """
+        Producer: turn rows into batches of {attname: value} dicts on queue,
+        giving up as soon as stop is set (the consumer failed). rows is
+        closed either way, so its file is too.
+        """
+        def put(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        try:
+            try:
+                columns = None
+                batch = []
+                for row in rows:
+                    if columns is None:
+                        columns = self.get_columns(row._fields)
+                    batch.append(dict((f.attname, self.convert(f, row[i])) for i, f in columns))
+                    if len(batch) >= self.batch_size:
+                        if not put(batch):
+                            return
+                        batch = []
+                if batch and not put(batch):
+                    return
+            except Exception:
+                put(sys.exc_info())
+                return
+            put(None)
+        finally:
+            if hasattr(rows, 'close'):
+                rows.close()
+
+    def key_index(self):
+        "{key values tuple: pk} for every existing object"
+        if not self.key_fields:
+            return {}
+        n = len(self.key_fields)
+        return dict((tuple(r[:n]), r[n]) for r in
+                    self.manager.values_list(*(self.key_fields + ('pk', ))))
+
+    def key_for(self, values):
+        return tuple(values[self.model._meta.get_field(f).attname] for f in self.key_fields)
+
+    def index_created(self, index, keys):
+        "Add pks for objects just bulk_created, which don't come back with them"
+        q = Q()
+        for key in keys:
+            q |= Q(**dict(zip(self.key_fields, key)))
+        n = len(self.key_fields)
+        for r in self.manager.filter(q).values_list(*(self.key_fields + ('pk', ))):
+            index[tuple(r[:n])] = r[n]
+
+    def write(self, batch, index, stats):
+        "Consumer: create or update one batch, in one transaction"
+        create, update = [], []
+        if self.key_fields:
+            # last row wins if a key shows up twice in a batch
+            by_key = {}
+            for values in batch:
+                by_key[self.key_for(values)] = values
+            for key, values in by_key.items():
+                if key in index:
+                    update.append((index[key], values))
+                else:
+                    create.append(values)
+        else:
+            create = batch
+
+        # the pk identifies the rows being updated, it isn't one of the updates
+        pk_name = self.model._meta.pk.attname
+        update = [(pk, dict((k, v) for k, v in values.items() if k != pk_name))
+                  for pk, values in update]
+        update_fields = list(update[0][1]) if update else []
+        with atomic(using=self.manager.db):
+            if create:
+                self.manager.bulk_create([self.model(**values) for values in create])
+            if update_fields and hasattr(self.manager, 'bulk_update'):
+                objs = [self.model(pk=pk, **values) for pk, values in update]
+                self.manager.bulk_update(objs, update_fields)
+            elif update_fields:
+                for pk, values in update:
+                    self.manager.filter(pk=pk).update(**values)
+
+        if create and self.key_fields:
+            self.index_created(index, [self.key_for(values) for values in create])
+        stats['rows'] += len(batch)
+        stats['created'] += len(create)
+        stats['updated'] += len(update)
+
+    def load(self, rows):
+        """
+        Load an iterable of Row namedtuples. Returns a dict of stats:
+        rows, created, updated, seconds and rows_per_sec.
+        """
+        stats = {'rows': 0, 'created': 0, 'updated': 0, 'seconds': 0.0, 'rows_per_sec': 0.0}
+        start = time.time()
+        index = self.key_index()
+        queue = Queue(maxsize=4)
+        stop = threading.Event()
+        producer = threading.Thread(target=self.parse, args=(rows, queue, stop))
+        producer.daemon = True
+        producer.start()
+
+        try:
+            while True:
+                batch = queue.get()
+                if batch is None:
+                    break
+                if isinstance(batch, tuple):  # the producer blew up
+                    exc_type, exc, tb = batch
+                    raise exc
+                self.write(batch, index, stats)
+                stats['seconds'] = time.time() - start
+                stats['rows_per_sec'] = stats['rows'] / (stats['seconds'] or 1e-9)
+                if self.progress:
+                    self.progress(stats)
+        finally:
+            # if write() raised, don't leave the producer blocked on a full queue
+            stop.set()
+            producer.join()
+        return stats
+
+    def load_csv(self, csv_path):
+        return self.load(generate_csv_rows(csv_path))
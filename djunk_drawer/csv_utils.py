@@ -1,7 +1,39 @@
 import csv
+import io
+import mmap
+import os
 import re
 
 from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+from itertools import islice
+
+from djunk_drawer.dates import DATE_FORMAT
+
+
+SPACES = re.compile(r'\s')
+# universal newlines: py3's text mode does them by default, and 3.11 dropped 'U'
+READ_MODE = 'rU' if bytes is str else 'r'
+NEWLINE = re.compile(br'\r\n?|\n')
+
+
+def normalize_headers(headers):
+    "Strip all whitespace from header names so they work as attribute names"
+    return tuple(re.sub(SPACES, '', i) for i in headers)
+
+
+def parse_date(value):
+    return datetime.strptime(value, DATE_FORMAT).date()
+
+
+# names usable in generate_csv_columns' types
+COERCERS = {
+    'int': int,
+    'float': float,
+    'decimal': Decimal,
+    'date': parse_date,
+}
 
 
 def generate_rows(f):
@@ -9,11 +41,10 @@ def generate_rows(f):
     Generator that builds Row namedtuple from first row, then
     yields Row's from subsequent rows
     """
-    spaces = re.compile(r'\s')
-    headers = tuple(re.sub(spaces, '', i) for i in next(f, tuple()))
-    Row = namedtuple('Row', headers)
+    headers = normalize_headers(next(f, tuple()))
+    make_row = namedtuple('Row', headers)._make
     for line in f:
-        yield Row(*(i.strip() for i in line))
+        yield make_row([i.strip() for i in line])
 
 
 def generate_csv_rows(csv_path):
@@ -24,7 +55,137 @@ def generate_csv_rows(csv_path):
             print line
 
     """
-    with open(csv_path, 'rU') as f:
+    with open(csv_path, READ_MODE) as f:
         reader = csv.reader(f)
         for line in generate_rows(reader):
             yield line
+
+
+def generate_columns(f, chunk_size=10000, types=None, arrays=False):
+    """
+    Generator that reads headers from the first row, then yields dicts of
+    header: list of values for up to chunk_size rows at a time.
+
+    Values are stripped like generate_rows. types maps headers to a name
+    in COERCERS ('int', 'float', 'decimal', 'date' in dates.DATE_FORMAT)
+    or any callable; empty strings in typed columns become None.
+
+    With arrays=True, columns come back as numpy arrays instead of lists.
+    """
+    headers = normalize_headers(next(f, tuple()))
+    width = len(headers)
+    coercers = dict((h, COERCERS.get(t, t)) for h, t in (types or {}).items())
+    if arrays:
+        import numpy
+
+    while True:
+        chunk = list(islice(f, chunk_size))
+        if not chunk:
+            return
+        if any(len(row) != width for row in chunk):
+            raise ValueError('Every row needs {0} fields, one per header'.format(width))
+        columns = {}
+        # zip(*rows) transposes the whole chunk in C
+        for header, values in zip(headers, zip(*chunk)):
+            values = [v.strip() for v in values]
+            coerce = coercers.get(header)
+            if coerce is not None:
+                values = [coerce(v) if v else None for v in values]
+            columns[header] = numpy.array(values) if arrays else values
+        yield columns
+
+
+def generate_csv_columns(csv_path, chunk_size=10000, types=None, arrays=False):
+    """
+    Wraps generate_columns with csv open, reader machinery. i.e.:
+
+        types = {'Amount': 'decimal', 'Date': 'date'}
+        for chunk in generate_csv_columns('data.csv', types=types):
+            total += sum(chunk['Amount'])
+
+    """
+    with open(csv_path, READ_MODE) as f:
+        reader = csv.reader(f)
+        for chunk in generate_columns(reader, chunk_size, types, arrays):
+            yield chunk
+
+
+def _next_row_end(mm, pos, quotes=0):
+    """
+    Offset just past the first line ending (LF, CRLF or a lone CR, like
+    'rU') at or after pos that isn't inside a quoted field, given the
+    number of quote chars seen since the last row boundary. Escaped quotes
+    come in pairs, so an odd count means we're inside a quoted field.
+    """
+    while True:
+        newline = NEWLINE.search(mm, pos)
+        if newline is None:
+            return len(mm)
+        quotes += mm[pos:newline.start()].count(b'"')
+        if quotes % 2 == 0:
+            return newline.end()
+        pos = newline.end()
+
+
+def csv_ranges(mm, start, chunk_bytes):
+    "Yield (start, end) offsets of roughly chunk_bytes each, split between rows"
+    size = len(mm)
+    while start < size:
+        target = min(start + chunk_bytes, size)
+        end = _next_row_end(mm, target, mm[start:target].count(b'"'))
+        yield start, end
+        start = end
+
+
+def _parse_range(args):
+    "Pool worker: parse and strip the rows between two offsets of a csv file"
+    csv_path, start, end = args
+    with open(csv_path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            data = mm[start:end]
+        finally:
+            mm.close()
+    # universal newlines, inside quoted fields too, like generate_csv_rows
+    data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    # a file-like object, so only real newlines end lines (splitlines()
+    # would also split on \x0c, \x1c-\x1e, \x85...)
+    if bytes is not str:  # py3's csv wants text
+        lines = io.StringIO(data.decode('utf-8'), newline='')
+    else:
+        lines = io.BytesIO(data)
+    return [tuple(i.strip() for i in line) for line in csv.reader(lines)]
+
+
+def generate_csv_rows_parallel(csv_path, processes=None, chunk_bytes=16 * 1024 * 1024):
+    """
+    Like generate_csv_rows, but for big files: the file is memory-mapped,
+    split into chunk_bytes pieces at row boundaries (respecting quoted
+    fields with newlines in them) and the pieces are parsed in a pool of
+    processes (default one per core). Rows still come out in file order,
+    as the same Row namedtuples.
+    """
+    if not os.path.getsize(csv_path):  # can't mmap an empty file
+        return
+    with open(csv_path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header_end = _next_row_end(mm, 0)
+            header = mm[:header_end]
+            ranges = [(csv_path, start, end) for start, end in csv_ranges(mm, header_end, chunk_bytes)]
+        finally:
+            mm.close()
+
+    if bytes is not str:
+        header = header.decode('utf-8')
+    make_row = namedtuple('Row', normalize_headers(next(csv.reader([header]), ())))._make
+
+    from multiprocessing import Pool
+    pool = Pool(processes)
+    try:
+        for rows in pool.imap(_parse_range, ranges):
+            for row in rows:
+                yield make_row(row)
+    finally:
+        pool.terminate()
+        pool.join()
@@ -15,11 +15,11 @@ Something like Arrow may be a better foundation:
 https://github.com/crsmithdev/arrow
 
 """
-import time
+import calendar
+from bisect import bisect_right
 
 from django.utils import timezone
-from datetime import time, timedelta
-from dateutil.relativedelta import relativedelta
+from datetime import datetime, time, timedelta
 
 
 DATE_FORMAT = '%m/%d/%Y'
@@ -42,32 +42,116 @@ def get_midnight_for_date(dt):
     return timezone.make_aware(naive_date, tz)
 
 
+GRANULARITIES = ('day', 'week', 'month', 'quarter', 'year')
+
+
+def get_period_start_date(d, granularity='day'):
+    "First date of the day/week/month/quarter/year containing date d. Weeks start Monday."
+    if granularity == 'day':
+        return d
+    if granularity == 'week':
+        return d - timedelta(days=d.weekday())
+    if granularity == 'month':
+        return d.replace(day=1)
+    if granularity == 'quarter':
+        return d.replace(month=(d.month - 1) // 3 * 3 + 1, day=1)
+    if granularity == 'year':
+        return d.replace(month=1, day=1)
+    raise ValueError(u"granularity must be one of {0}".format(', '.join(GRANULARITIES)))
+
+
+def get_next_period_start_date(d, granularity='day'):
+    "First date of the period after the one starting on date d (see get_period_start_date)"
+    if granularity == 'day':
+        return d + timedelta(days=1)
+    if granularity == 'week':
+        return d + timedelta(weeks=1)
+    months = {'month': 1, 'quarter': 3, 'year': 12}[granularity]
+    month = d.month - 1 + months
+    return d.replace(year=d.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def make_aware_midnight(d, tz):
+    """
+    Midnight at the start of date d in tz. Some zones (i.e. Santiago,
+    Havana, Beirut) start DST at midnight, so there's no midnight that
+    day: then it's the first instant after the gap (1am). If midnight
+    happens twice, it's the first one.
+    """
+    naive = datetime.combine(d, time.min)
+    if not hasattr(tz, 'localize'):  # not pytz, no errors to worry about
+        return timezone.make_aware(naive, tz)
+    from pytz.exceptions import AmbiguousTimeError, NonExistentTimeError
+    try:
+        return tz.localize(naive, is_dst=None)
+    except NonExistentTimeError:
+        # midnight in standard time is the instant DST starts
+        return tz.normalize(tz.localize(naive, is_dst=False))
+    except AmbiguousTimeError:
+        return tz.localize(naive, is_dst=True)
+
+
+def period_bounds(dt, granularity='day', tz=None):
+    """
+    (start, end) of the day/week/month/quarter/year containing tz-aware dt,
+    in tz (default django current tz). start is midnight of the period's
+    first day, end is midnight of the next period's first day, so filter
+    with start <= x < end, i.e.:
+
+        start, end = period_bounds(local_now(), 'month')
+        Thing.objects.filter(created__gte=start, created__lt=end)
+
+    Both ends are localized separately (see make_aware_midnight), so a
+    period with a DST change in it is correctly an hour longer or shorter.
+    """
+    tz = tz or timezone.get_current_timezone()
+    start_date = get_period_start_date(dt.astimezone(tz).date(), granularity)
+    return (make_aware_midnight(start_date, tz),
+            make_aware_midnight(get_next_period_start_date(start_date, granularity), tz))
+
+
+# (name, zone, granularity): (period start, period end, value)
+_period_cache = {}
+
+
+def cached_for_period(name, granularity, compute, tz=None):
+    """
+    compute(start, end) for the current period, computed once and reused
+    until now() passes the end of the period.
+    """
+    tz = tz or timezone.get_current_timezone()
+    now = timezone.now()
+    key = (name, getattr(tz, 'zone', None) or repr(tz), granularity)
+    cached = _period_cache.get(key)
+    if cached is None or not cached[0] <= now < cached[1]:
+        start, end = period_bounds(now, granularity, tz)
+        cached = _period_cache[key] = (start, end, compute(start, end))
+    return cached[2]
+
+
+def current_period_bounds(granularity='day', tz=None):
+    "period_bounds for now, cached until the period ends"
+    return cached_for_period('bounds', granularity, lambda start, end: (start, end), tz)
+
+
 def get_yesterday_midnight():
-    now = local_now()
-    naive_now_date = timezone.make_naive(now, now.tzinfo).date()
-    return timezone.make_aware(
-        timezone.datetime.combine(naive_now_date, time.max) - timedelta(days=1),
-        now.tzinfo)
+    return cached_for_period(
+        'yesterday_midnight', 'day',
+        lambda start, end: get_midnight_for_date(start - timedelta(days=1)))
 
 
 def get_tonight_midnight():
-    now = local_now()
-    naive_midnight = timezone.datetime.combine(timezone.make_naive(now, now.tzinfo).date(), time.max)
-    return timezone.make_aware(naive_midnight, now.tzinfo)
+    return cached_for_period(
+        'tonight_midnight', 'day',
+        lambda start, end: get_midnight_for_date(start))
 
 
 def get_year_start():
-    now = local_now()
-    return timezone.make_aware(
-               timezone.datetime(year=now.year, month=1, day=1),
-               timezone.get_current_timezone())
+    return current_period_bounds('year')[0]
 
 
 def get_month_start():
-    now = local_now()
-    return timezone.make_aware(
-               timezone.datetime(year=now.year, month=now.month, day=1),
-               timezone.get_current_timezone())
+    return current_period_bounds('month')[0]
 
 
 def format_local_datetime(dt, df=DATETIME_FORMAT):
@@ -82,11 +166,104 @@ def format_local_date(dt, df=DATE_FORMAT):
 
 def datetime_to_timestamp(dt):
     "Convert tz-aware datetime to utc timestamp"
-    return int(time.mktime(dt.astimezone(timezone.utc).timetuple()))
+    return calendar.timegm(dt.utctimetuple())
 
 
-def timestamp_to_datetime(timestamp, tz=timezone.get_current_timezone()):
+def timestamp_to_datetime(timestamp, tz=None):
     "Convert utc timestamp to datetime in tz (default django current tz)"
     return timezone.make_aware(
-               timezone.datetime.utcfromtimestamp(tz),
-               timezone.get_default_timezone())
+               timezone.datetime.utcfromtimestamp(timestamp),
+               timezone.utc).astimezone(tz or timezone.get_current_timezone())
+
+
+# Bulk versions of the above, for converting lots of values at once.
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_UTC = timezone.make_aware(EPOCH, timezone.utc)
+
+# zone name: (utc transition times in microseconds, utc offsets in
+# microseconds, tzinfos) for each zone we've converted to
+_transition_tables = {}
+
+
+def _micros(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def transition_table(tz):
+    """
+    A zone's DST transitions as (utc times, offsets, tzinfos), all in
+    microseconds since the epoch, so converting a utc time to local is a
+    binary search instead of a trip through astimezone(). Built once per
+    zone. None for zones that don't expose their transitions (non-pytz).
+    """
+    key = getattr(tz, 'zone', None) or repr(tz)
+    if key in _transition_tables:
+        return _transition_tables[key]
+
+    table = None
+    if hasattr(tz, '_utc_transition_times'):  # pytz zone with DST
+        table = (
+            [_micros(t - EPOCH) for t in tz._utc_transition_times],
+            [_micros(info[0]) for info in tz._transition_info],
+            [tz._tzinfos[info] for info in tz._transition_info],
+            )
+    else:
+        offset = tz.utcoffset(None)
+        if offset is not None:  # fixed offset zones, including utc
+            table = ([_micros(datetime.min - EPOCH)], [_micros(offset)], [tz])
+    _transition_tables[key] = table
+    return table
+
+
+def _is_datetime64(values):
+    return getattr(getattr(values, 'dtype', None), 'kind', None) == 'M'
+
+
+def timestamps_to_datetimes(timestamps, tz=None):
+    """
+    Convert a sequence of utc timestamps (or a numpy datetime64 array) to
+    datetimes in tz (default django current tz), DST and all. Returns a
+    list.
+    """
+    tz = tz or timezone.get_current_timezone()
+    if _is_datetime64(timestamps):
+        micros = timestamps.astype('datetime64[us]').astype('int64').tolist()
+    else:
+        micros = [int(round(ts * 1000000)) for ts in timestamps]
+    return _from_micros(micros, tz, hasattr(timestamps, 'dtype'))
+
+
+def _from_micros(micros, tz, vectorize=False):
+    "utc microseconds since the epoch to datetimes in tz"
+    table = transition_table(tz)
+    if table is None:
+        return [(EPOCH_UTC + timedelta(microseconds=us)).astimezone(tz) for us in micros]
+
+    times, offsets, tzinfos = table
+    if len(times) == 1:
+        indexes = [0] * len(micros)
+    elif vectorize:
+        import numpy
+        indexes = (numpy.searchsorted(times, micros, side='right') - 1).tolist()
+    else:
+        indexes = [bisect_right(times, us) - 1 for us in micros]
+
+    return [(EPOCH + timedelta(microseconds=us + offsets[i])).replace(tzinfo=tzinfos[i])
+            for us, i in zip(micros, indexes)]
+
+
+def datetimes_to_timestamps(dts):
+    "Convert a sequence of tz-aware datetimes to utc timestamps (ints), as a list"
+    return [_micros(dt - EPOCH_UTC) // 1000000 for dt in dts]
+
+
+def localize_datetimes(dts, tz=None):
+    "Convert a sequence of tz-aware datetimes to tz (default django current tz)"
+    return _from_micros([_micros(dt - EPOCH_UTC) for dt in dts],
+                        tz or timezone.get_current_timezone())
+
+
+def format_local_datetimes(dts, df=DATETIME_FORMAT, tz=None):
+    "Bulk format_local_datetime: convert a sequence of datetimes to tz and format them"
+    return [dt.strftime(df) for dt in localize_datetimes(dts, tz)]
@@ -1,9 +1,284 @@
+import threading
+from datetime import datetime, time
 
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, DateTimeField, Model, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from djunk_drawer.dates import GRANULARITIES, make_aware_midnight, period_bounds
+
+
+_identity_map = threading.local()
+
+
+def start_identity_map():
+    "Remember objects found by get_first_or_none(_many) in this thread until clear_identity_map"
+    _identity_map.objects = {}
+
+
+def clear_identity_map():
+    _identity_map.objects = None
+
+
+def _identity_key(model, kwargs):
+    "Key for model/kwargs in the identity map, or None if not mapping or unhashable"
+    if getattr(_identity_map, 'objects', None) is None:
+        return None
+    key = (model, frozenset(kwargs.items()))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _remember(model, key, obj):
+    if key is not None:
+        _identity_map.objects[key] = obj
+        _identity_map.objects[(model, frozenset([('pk', obj.pk)]))] = obj
 
 
 def get_first_or_none(model, **kwargs):
-    "Try to get an object by **kwargs. return the first object or None"
+    """
+    Try to get an object by **kwargs. return the first object or None
+
+    Inside IdentityMapMiddleware (or start_identity_map()), objects found
+    are remembered, by kwargs and by pk, for the rest of the request.
+    """
+    key = _identity_key(model, kwargs)
+    if key is not None and key in _identity_map.objects:
+        return _identity_map.objects[key]
     try:
-        return model._default_manager.filter(**kwargs)[0]
+        obj = model._default_manager.filter(**kwargs)[0]
     except IndexError:
         return None
+    _remember(model, key, obj)
+    return obj
+
+
+def _lookup(model, name):
+    "(attname on instances, field whose to_python normalizes values) for a kwarg name"
+    field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+    if getattr(field, 'rel', None):
+        return field.attname, field.rel.get_related_field()
+    return field.attname, field
+
+
+string_types = (str, type(u''))
+
+
+def _loose(values):
+    """
+    values compared the way a case insensitive, PAD SPACE collation (i.e.
+    mysql's defaults) would, to spot rows the db matched that == doesn't
+    """
+    return tuple(v.lower().rstrip(' ') if isinstance(v, string_types) else v for v in values)
+
+
+def get_first_or_none_many(model, kwargs_list, batch_size=500):
+    """
+    get_first_or_none for many sets of kwargs on the same model, i.e.:
+
+        users = get_first_or_none_many(User, [{'email': e} for e in emails])
+
+    Plain field=value kwargs are OR'ed together into one query per
+    batch_size of them, instead of a query each. Kwargs with lookups
+    (field__in=...) are looked up one at a time. Returns a list of
+    objects or None, in the same order as kwargs_list.
+
+    Rows are matched back to kwargs by value in python. When python and
+    the db disagree about what matches (different case or trailing spaces
+    under mysql's default collation, a naive datetime under USE_TZ...),
+    kwargs that might be affected fall back to their own get_first_or_none:
+    those whose values loosely match a row's, and, if the db returned a row
+    no kwargs matched in python, every kwargs left unmatched.
+    """
+    results = [None] * len(kwargs_list)
+    pending = []
+    for i, kwargs in enumerate(kwargs_list):
+        key = _identity_key(model, kwargs)
+        if key is not None and key in _identity_map.objects:
+            results[i] = _identity_map.objects[key]
+        elif not kwargs or any('__' in name for name in kwargs):
+            results[i] = get_first_or_none(model, **kwargs)
+        else:
+            pending.append((i, kwargs, key))
+
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        q = Q()
+        for i, kwargs, key in batch:
+            q |= Q(**kwargs)
+        candidates = list(model._default_manager.filter(q))
+
+        # index candidates (by position) by the values of each set of names
+        # asked for, in order, so the first matches what filter(**kwargs)[0] would
+        indexes = {}
+        explained = set()  # positions of candidates some kwargs matched
+        unmatched = []
+        for i, kwargs, key in batch:
+            names = tuple(sorted(kwargs))
+            lookups = [_lookup(model, name) for name in names]
+            if names not in indexes:
+                index, loose_index = indexes[names] = ({}, {})
+                for position, obj in enumerate(candidates):
+                    obj_values = tuple(getattr(obj, a) for a, f in lookups)
+                    index.setdefault(obj_values, []).append(position)
+                    loose_index.setdefault(_loose(obj_values), []).append(position)
+            index, loose_index = indexes[names]
+            values = tuple(
+                f.to_python(v.pk if isinstance(v, Model) else v)
+                for (a, f), v in zip(lookups, (kwargs[n] for n in names)))
+            if values in index:
+                explained.update(index[values])
+                results[i] = obj = candidates[index[values][0]]
+                _remember(model, key, obj)
+            elif _loose(values) in loose_index:
+                explained.update(loose_index[_loose(values)])
+                results[i] = get_first_or_none(model, **kwargs)
+            else:
+                unmatched.append((i, kwargs))
+
+        if unmatched and len(explained) < len(candidates):
+            for i, kwargs in unmatched:
+                results[i] = get_first_or_none(model, **kwargs)
+    return results
+
+
+def date_range_buckets(dates, granularity='month', tz=None):
+    """
+    Split (from_date, to_date) into a list of (start, end) ranges, one per
+    day/week/month/quarter/year (see dates.period_bounds), clipped to the
+    dates. Ranges are start <= x < end, except the last, which ends at
+    to_date inclusive like DateRangeWidget.date_range_filter.
+
+    A range open at either end (None, as DateRangeWidget gives for a blank
+    date) is a single bucket, unsplit. A reversed range has no buckets.
+    """
+    from_date, to_date = dates
+    if not from_date or not to_date:
+        return [(from_date, to_date)]
+    buckets = []
+    start = from_date
+    while start <= to_date:
+        end = period_bounds(start, granularity, tz)[1]
+        buckets.append((start, min(end, to_date)))
+        start = end
+    return buckets
+
+
+def date_range_bucket_filters(dates, field_name, granularity='month', tz=None):
+    """
+    Like DateRangeWidget.date_range_filter, but a list of filter dicts, one
+    per bucket from date_range_buckets. Each is a narrow range query that
+    can use an index (or hit a single partition) on its own. Open ended
+    ranges give a single filter, just like date_range_filter's.
+    """
+    buckets = date_range_buckets(dates, granularity, tz)
+    if not buckets:
+        return []
+    filters = [{'{0}__gte'.format(field_name): start, '{0}__lt'.format(field_name): end}
+               for start, end in buckets[:-1]]
+    start, end = buckets[-1]
+    last = {}
+    if start:
+        last['{0}__gte'.format(field_name)] = start
+    if end:
+        last['{0}__lte'.format(field_name)] = end
+    filters.append(last)
+    return filters
+
+
+def map_date_range(queryset, dates, field_name, func, granularity='month', workers=4, tz=None):
+    """
+    Run func on queryset filtered to each bucket of dates, `workers` buckets
+    at a time in threads, and return the results in bucket order. i.e.:
+
+        counts = map_date_range(Event.objects.all(), dates, 'created',
+                                lambda qs: qs.count(), 'week')
+
+    func should evaluate its queryset; each thread has its own db
+    connection, closed when its bucket is done.
+    """
+    def run(filters):
+        try:
+            return func(queryset.filter(**filters))
+        finally:
+            for connection in connections.all():
+                connection.close()
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(run, date_range_bucket_filters(dates, field_name, granularity, tz))
+    finally:
+        pool.close()
+        pool.join()
+
+
+# granularities older djangos can't truncate to, and the first that can
+TRUNC_VERSIONS = {'quarter': (2, 0), 'week': (2, 1)}
+
+
+def _period_start(value, field):
+    """
+    A period from the date_trunc_sql fallback (a datetime, or a string on
+    sqlite) as Trunc would give it: a date for a DateField, midnight for a
+    DateTimeField, aware in the current tz under USE_TZ
+    """
+    if value is None:
+        return None
+    if isinstance(value, string_types):
+        value = parse_datetime(value) or parse_date(value)
+    day = value.date() if isinstance(value, datetime) else value
+    if not isinstance(field, DateTimeField):
+        return day
+    if settings.USE_TZ:
+        return make_aware_midnight(day, timezone.get_current_timezone())
+    return datetime.combine(day, time.min)
+
+
+def count_by_period(queryset, field_name, granularity='day'):
+    """
+    [(period start, count), ...] for queryset grouped by day/week/month/
+    quarter/year of field_name, in one GROUP BY query. Filter queryset
+    with DateRangeWidget.date_range_filter first to limit the range.
+
+    Periods are dates for a DateField, and for a DateTimeField midnights
+    in the current tz (aware under USE_TZ).
+
+    Quarters need Django >= 2.0 and weeks Django >= 2.1; before that, or
+    for anything but GRANULARITIES, raises ValueError.
+    """
+    import django
+    if granularity not in GRANULARITIES:
+        raise ValueError(u"granularity must be one of {0}".format(', '.join(GRANULARITIES)))
+    if django.VERSION[:2] < TRUNC_VERSIONS.get(granularity, (0, )):
+        raise ValueError(u"Counting by {0} needs Django {1}.{2}".format(
+            granularity, *TRUNC_VERSIONS[granularity]))
+
+    try:
+        from django.db.models.functions import Trunc
+    except ImportError:  # Django < 1.10
+        pass
+    else:
+        queryset = queryset.annotate(period=Trunc(field_name, granularity))
+        rows = queryset.values('period').annotate(count=Count('pk')).order_by('period')
+        return [(row['period'], row['count']) for row in rows]
+
+    connection = connections[queryset.db]
+    field = queryset.model._meta.get_field(field_name)
+    column = u"{0}.{1}".format(
+        connection.ops.quote_name(queryset.model._meta.db_table),
+        connection.ops.quote_name(field.column))
+    if isinstance(field, DateTimeField) and hasattr(connection.ops, 'datetime_trunc_sql'):
+        # Django >= 1.6: truncate in the current tz, like Trunc
+        tzname = timezone.get_current_timezone_name() if settings.USE_TZ else None
+        sql, params = connection.ops.datetime_trunc_sql(granularity, column, tzname)
+    else:
+        sql, params = connection.ops.date_trunc_sql(granularity, column), []
+    queryset = queryset.extra(select={'period': sql}, select_params=params)
+    rows = queryset.values('period').annotate(count=Count('pk')).order_by('period')
+    return [(_period_start(row['period'], field), row['count']) for row in rows]
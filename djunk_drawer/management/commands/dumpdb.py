@@ -1,62 +1,565 @@
+import bz2
+import hashlib
+import json
 import os
 import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
 from datetime import datetime
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from djunk_drawer import portable_dump
+from djunk_drawer.management.options import add_options, make_option_list
+
+
+MYSQL_BACKENDS = ('django.db.backends.mysql', )
+PG_BACKENDS = (
+    'django.db.backends.postgresql_psycopg2',
+    'django.db.backends.postgresql',
+    'django.contrib.gis.db.backends.postgis',
+    )
+SQLITE_BACKENDS = ('django.db.backends.sqlite3', )
+
+CHUNK_SIZE = 1024 * 1024
+
+atomic = getattr(transaction, 'atomic', None) or transaction.commit_on_success
+
+
+class NullCompressor(object):
+    "Pass-through 'compressor' so every dump goes down the same pipe"
+    def compress(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+    def decompress(self, data):
+        return data
+
+
+def gzip_compressor():
+    # wbits of 16 + MAX_WBITS makes zlib write a gzip header and trailer
+    return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def xz_compressor():
+    import lzma
+    return lzma.LZMACompressor()
+
+
+def zstd_compressor():
+    import zstandard
+    return zstandard.ZstdCompressor().compressobj()
+
+
+def gzip_decompressor():
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+def xz_decompressor():
+    import lzma
+    return lzma.LZMADecompressor()
+
+
+def zstd_decompressor():
+    import zstandard
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+# name: (compressor factory, file extension)
+COMPRESSORS = {
+    'none': (NullCompressor, ''),
+    'gzip': (gzip_compressor, '.gz'),
+    'bz2': (bz2.BZ2Compressor, '.bz2'),
+    'xz': (xz_compressor, '.xz'),
+    'zstd': (zstd_compressor, '.zst'),
+}
+
+# file extension: decompressor factory
+DECOMPRESSORS = {
+    '.gz': gzip_decompressor,
+    '.bz2': bz2.BZ2Decompressor,
+    '.xz': xz_decompressor,
+    '.zst': zstd_decompressor,
+}
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def get_backup_dir():
+    "settings.DB_BACKUP_DIR, defaulting to ${HOME}/tmp/[name of virtualenv or 'django']"
+    default_backup = u"{0}/tmp/{1}".format(
+        os.environ.get('HOME'),
+        os.environ.get('VIRTUAL_ENV', 'django').split('/')[-1],
+        )
+    return os.environ.get('DB_BACKUP_DIR', default_backup)
+
+
+def get_dump_command(db):
+    "Shell command that writes a dump of db to stdout, or None if unsupported"
+    if db['ENGINE'] in MYSQL_BACKENDS:
+        return u"mysqldump -u {USER} -p{PASSWORD} {NAME}".format(**db)
+    elif db['ENGINE'] in PG_BACKENDS:
+        return u"export PGPASSWORD='{PASSWORD}' && pg_dump -Fc -U {USER} {NAME}".format(**db)
+    return None
+
+
+def get_table_dump_command(db, table, snapshot=None):
+    """
+    Shell command that writes a dump of a single table to stdout, or None.
+
+    For postgres, snapshot is an exported snapshot id (see
+    exported_snapshot) to dump the table as of.
+    """
+    if db['ENGINE'] in MYSQL_BACKENDS:
+        return u"mysqldump --single-transaction -u {USER} -p{PASSWORD} {NAME} {table}".format(
+            table=table, **db)
+    elif db['ENGINE'] in PG_BACKENDS:
+        return u"export PGPASSWORD='{PASSWORD}' && pg_dump -Fc -U {USER}{snapshot} -t '{table}' {NAME}".format(
+            table=table, snapshot=u" --snapshot={0}".format(snapshot) if snapshot else u"", **db)
+    elif db['ENGINE'] in SQLITE_BACKENDS:
+        return u"sqlite3 {NAME} \".dump '{table}'\"".format(table=table, **db)
+    return None
+
+
+def get_table_restore_command(db):
+    "Shell command that restores a table dump read from stdin, or None"
+    if db['ENGINE'] in MYSQL_BACKENDS:
+        return u"mysql -u {USER} -p{PASSWORD} {NAME}".format(**db)
+    elif db['ENGINE'] in PG_BACKENDS:
+        return u"export PGPASSWORD='{PASSWORD}' && pg_restore -U {USER} -d {NAME}".format(**db)
+    elif db['ENGINE'] in SQLITE_BACKENDS:
+        return u"sqlite3 {NAME}".format(**db)
+    return None
+
+
+def stream_to_file(src, path, compressor, chunk_size=CHUNK_SIZE, digest=None):
+    """
+    Read src in chunk_size pieces, compress and write them to path.
+
+    Only one chunk is ever held in memory, so the uncompressed dump never
+    touches the disk. If given, digest (a hashlib object) is updated with
+    the bytes written. Returns (bytes read, bytes written).
+    """
+    bytes_in = bytes_out = 0
+    with open(path, 'wb') as out:
+        def write(data):
+            out.write(data)
+            if digest is not None:
+                digest.update(data)
+            return len(data)
+
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            bytes_in += len(chunk)
+            bytes_out += write(compressor.compress(chunk))
+        bytes_out += write(compressor.flush())
+    return bytes_in, bytes_out
+
+
+def stream_from_file(path, dest, chunk_size=CHUNK_SIZE):
+    "Decompress path (by extension) into dest, a chunk at a time"
+    decompressor = DECOMPRESSORS.get(os.path.splitext(path)[1], NullCompressor)()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            dest.write(decompressor.decompress(chunk))
+    # not every decompressor has (or needs) a flush
+    if hasattr(decompressor, 'flush'):
+        dest.write(decompressor.flush())
+
+
+def file_checksum(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def run_piped(command, stdout=None, stdin=None):
+    """
+    Popen command with a temp file for stderr, so it can't deadlock the
+    pipe or end up inside a dump. Returns (process, stderr file).
+    """
+    err = tempfile.TemporaryFile()
+    p = subprocess.Popen(command, shell=True, stdin=stdin, stdout=stdout, stderr=err)
+    return p, err
+
+
+def wait_piped(p, err):
+    "Wait for a run_piped process, returning an error message or None"
+    returncode = p.wait()
+    try:
+        if returncode != 0:
+            err.seek(0)
+            return u"exit status {0}: {1}".format(
+                returncode, err.read().decode('utf-8', 'replace').strip())
+        return None
+    finally:
+        err.close()
+
+
+def dump_database(alias, backup_dir, compression='none', chunk_size=CHUNK_SIZE):
+    """
+    Dump the database at settings.DATABASES[alias] into backup_dir.
+
+    Blocks until the dump command exits and returns a dict of stats:
+    alias, path, bytes_in, bytes_out, seconds and error (None on success).
+    """
+    db = settings.DATABASES[alias]
+    factory, ext = COMPRESSORS[compression]
+    stats = {'alias': alias, 'path': None, 'bytes_in': 0, 'bytes_out': 0,
+             'seconds': 0.0, 'error': None}
+
+    command = get_dump_command(db)
+    if command is None:
+        stats['error'] = u"Unsupported database backend {0}".format(db['ENGINE'])
+        return stats
+
+    stats['path'] = u"{0}/{1}.{2}.sql{3}".format(
+        backup_dir,
+        os.path.basename(db['NAME']),
+        datetime.now().strftime('%Y%m%d-%H%M'),
+        ext,
+        )
+
+    start = time.time()
+    p, err = run_piped(command, stdout=subprocess.PIPE)
+    try:
+        stats['bytes_in'], stats['bytes_out'] = stream_to_file(
+            p.stdout, stats['path'], factory(), chunk_size)
+    finally:
+        p.stdout.close()
+        stats['error'] = wait_piped(p, err)
+    stats['seconds'] = time.time() - start
+    return stats
+
+
+class Manifest(object):
+    """
+    Record of a per-table dump, kept as manifest.json in the dump dir.
+
+    Each entry has table, file, rows, bytes_in, bytes (on disk), checksum
+    (sha256 of the file) and seconds. The manifest is rewritten after every
+    table finishes, so an interrupted dump can be resumed from whatever
+    tables are missing or don't match their checksum.
+    """
+    def __init__(self, dump_dir, alias=None, engine=None):
+        self.path = os.path.join(dump_dir, MANIFEST_NAME)
+        self.data = {'alias': alias, 'engine': engine, 'tables': {}}
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.data = json.load(f)
+
+    @property
+    def tables(self):
+        return self.data['tables']
+
+    def is_done(self, table):
+        "True if table was dumped and its file is still intact"
+        entry = self.tables.get(table)
+        if entry is None:
+            return False
+        path = os.path.join(os.path.dirname(self.path), entry['file'])
+        return os.path.exists(path) and file_checksum(path) == entry['checksum']
+
+    def add(self, entry):
+        with self.lock:
+            self.tables[entry['table']] = entry
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.data, f, indent=2, sort_keys=True)
+            os.rename(tmp_path, self.path)
+
+
+class exported_snapshot(object):
+    """
+    Context manager holding a repeatable read transaction open on alias's
+    connection (in this thread) and giving its exported snapshot id, so
+    pg_dump --snapshot and count_rows in other threads all see the
+    database as of the same moment. None for non-postgres backends.
+    """
+    def __init__(self, alias):
+        self.alias = alias
+        self.atomic = None
+
+    def __enter__(self):
+        if settings.DATABASES[self.alias]['ENGINE'] not in PG_BACKENDS:
+            return None
+        connection = connections[self.alias]
+        connection.close()  # start from a fresh transaction
+        self.atomic = atomic(using=self.alias)
+        self.atomic.__enter__()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cursor.execute("SELECT pg_export_snapshot()")
+            return cursor.fetchone()[0]
+        except Exception:
+            self.atomic.__exit__(*sys.exc_info())
+            raise
+
+    def __exit__(self, *exc_info):
+        if self.atomic is not None:
+            return self.atomic.__exit__(*exc_info)
+
+
+def count_rows(alias, table, snapshot=None):
+    "Rows in table, as of the exported snapshot if given (postgres only)"
+    connection = connections[alias]
+    with atomic(using=alias):
+        cursor = connection.cursor()
+        if snapshot:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cursor.execute("SET TRANSACTION SNAPSHOT %s", [snapshot])
+        cursor.execute(u"SELECT COUNT(*) FROM {0}".format(connection.ops.quote_name(table)))
+        return cursor.fetchone()[0]
+
+
+def dump_table(alias, table, dump_dir, compression='none', chunk_size=CHUNK_SIZE, snapshot=None):
+    """
+    Dump a single table of settings.DATABASES[alias] into dump_dir, as of
+    snapshot if given (see exported_snapshot).
+
+    Returns a manifest entry dict, with 'error' set if the dump failed.
+    """
+    db = settings.DATABASES[alias]
+    factory, ext = COMPRESSORS[compression]
+    entry = {'table': table, 'file': u"{0}.sql{1}".format(table, ext), 'error': None}
+
+    start = time.time()
+    try:
+        entry['rows'] = count_rows(alias, table, snapshot)
+    finally:
+        # each worker thread gets its own connection; don't leak them
+        connections[alias].close()
+
+    digest = hashlib.sha256()
+    p, err = run_piped(get_table_dump_command(db, table, snapshot), stdout=subprocess.PIPE)
+    try:
+        entry['bytes_in'], entry['bytes'] = stream_to_file(
+            p.stdout, os.path.join(dump_dir, entry['file']), factory(), chunk_size, digest)
+    finally:
+        p.stdout.close()
+        entry['error'] = wait_piped(p, err)
+    entry['checksum'] = digest.hexdigest()
+    entry['seconds'] = time.time() - start
+    return entry
+
+
+def restore_table(alias, entry, dump_dir, chunk_size=CHUNK_SIZE):
+    "Restore one manifest entry into settings.DATABASES[alias], returning an error or None"
+    path = os.path.join(dump_dir, entry['file'])
+    if file_checksum(path) != entry['checksum']:
+        return u"checksum mismatch for {0}".format(path)
+    p, err = run_piped(get_table_restore_command(settings.DATABASES[alias]), stdin=subprocess.PIPE)
+    try:
+        stream_from_file(path, p.stdin, chunk_size)
+    finally:
+        p.stdin.close()
+        error = wait_piped(p, err)
+    return error
+
+
+def run_parallel(func, items, workers):
+    "map func over items with at most `workers` threads, yielding results as they finish"
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(max(1, min(workers, len(items) or 1)))
+    try:
+        for result in pool.imap_unordered(func, items):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def format_table_stats(entry):
+    seconds = entry['seconds'] or 1e-9
+    return u"{table}: {rows} rows, {mb:.1f} MB in {seconds:.1f}s ({rps:.0f} rows/s, {rate:.1f} MB/s)".format(
+        table=entry['table'],
+        rows=entry['rows'],
+        mb=entry['bytes_in'] / 1048576.0,
+        seconds=entry['seconds'],
+        rps=entry['rows'] / seconds,
+        rate=entry['bytes_in'] / 1048576.0 / seconds,
+        )
+
+
+def format_stats(stats):
+    "One line summary of dump_database stats: size, throughput and ratio"
+    seconds = stats['seconds'] or 1e-9
+    ratio = float(stats['bytes_in']) / stats['bytes_out'] if stats['bytes_out'] else 0
+    return u"{alias}: {mb_in:.1f} MB in {seconds:.1f}s ({rate:.1f} MB/s), ratio {ratio:.2f}".format(
+        alias=stats['alias'],
+        mb_in=stats['bytes_in'] / 1048576.0,
+        seconds=stats['seconds'],
+        rate=stats['bytes_in'] / 1048576.0 / seconds,
+        ratio=ratio,
+        )
+
+
+OPTIONS = (
+    (('--database', ), dict(action='append', dest='databases', default=[],
+                            help='Database alias to dump. May be given more than once.')),
+    (('--all', ), dict(action='store_true', dest='all_databases', default=False,
+                       help='Dump every database in settings.DATABASES.')),
+    (('--compress', ), dict(dest='compression', default='none', choices=sorted(COMPRESSORS),
+                            help='Compress output with one of: {0}.'.format(', '.join(sorted(COMPRESSORS))))),
+    (('--workers', ), dict(dest='workers', type=int, default=2,
+                           help='Max number of dumps to run at once.')),
+    (('--chunk-size', ), dict(dest='chunk_size', type=int, default=CHUNK_SIZE,
+                              help='Bytes read from the dump command per chunk.')),
+    (('--parallel', ), dict(dest='parallel', type=int, default=0,
+                            help='Dump one file per table, this many tables at a time.')),
+    (('--resume', ), dict(dest='resume', default=None,
+                          help='Per-table dump directory to resume. Implies --parallel.')),
+    (('--portable', ), dict(action='store_true', dest='portable', default=False,
+                            help='Dump through the ORM, one file per model, for any backend.')),
+    (('--batch-size', ), dict(dest='batch_size', type=int, default=portable_dump.CHUNK_SIZE,
+                              help='Rows fetched per query with --portable.')),
+    )
 
 
 class Command(BaseCommand):
     """
-    Dump default db to file in settings.DB_BACKUP_DIR.
+    Dump dbs to files in settings.DB_BACKUP_DIR.
 
     DB_BACKUP_DIR defaults to ${HOME}/tmp/[name of virtualenv or 'django']
 
-    TODO:
-    - how to gzip the file? i.e. 'mysqldump | gzip > foo.sql.gz'?
-    - more than default db?
+    Dumps the default db unless --database or --all is given. Output is
+    streamed through the --compress compressor in memory, and several
+    dbs are dumped concurrently with up to --workers dumps at a time.
+
+    With --parallel N, each db is dumped one table per file into its own
+    directory, N tables at a time, along with a manifest.json (see
+    Manifest). Pass that directory to --resume to finish an interrupted
+    dump, and to the restoredb command to load it back. On postgres every
+    table is dumped from one exported snapshot, so they're consistent with
+    each other (though a resumed dump is a second snapshot). mysqldump
+    can't share a snapshot between processes, so on mysql (and sqlite)
+    each table is consistent on its own but not with the others; use a
+    plain dump of a live database if that matters.
+
+    With --portable, each db is dumped through the ORM instead of the
+    native tools (see djunk_drawer.portable_dump), which works for any
+    backend, SQLite included. restoredb loads these too.
+
+    Paths of finished dumps are written to stdout, one per line, and
+    throughput stats for each db (or table) to stderr.
     """
+    option_list = make_option_list(OPTIONS)
+
+    def add_arguments(self, parser):
+        add_options(parser, OPTIONS)
+
     def handle(self, *args, **options):
-        # get backup_dir
-        default_backup = u"{0}/tmp/{1}".format(
-            os.environ.get('HOME'),
-            os.environ.get('VIRTUAL_ENV', 'django').split('/')[-1],
-            )
-        backup_dir = os.environ.get('DB_BACKUP_DIR', default_backup)
+        if options['all_databases']:
+            aliases = list(settings.DATABASES)
+        else:
+            aliases = options['databases'] or ['default']
+        for alias in aliases:
+            if alias not in settings.DATABASES:
+                raise CommandError(u"Unknown database {0}".format(alias))
+
+        # fail early if the compressor's module isn't installed
+        try:
+            COMPRESSORS[options['compression']][0]()
+        except ImportError as e:
+            raise CommandError(u"Can't use {0} compression: {1}".format(options['compression'], e))
 
         # create if need be and cd
+        backup_dir = get_backup_dir()
         if not os.path.exists(backup_dir):
             os.makedirs(backup_dir)
         os.chdir(backup_dir)
 
-        # get db info
-        db = settings.DATABASES['default']
-        db_type = db['ENGINE']
-        backup_path = u"{0}/{1}.{2}.sql".format(
+        if options['portable']:
+            for alias in aliases:
+                self.handle_portable(alias, backup_dir, options)
+            return
+
+        if options['resume'] or options['parallel']:
+            if options['resume'] and len(aliases) > 1:
+                raise CommandError("--resume only works with a single database")
+            for alias in aliases:
+                self.handle_tables(alias, backup_dir, options)
+            return
+
+        def dump(alias):
+            return dump_database(alias, backup_dir, options['compression'], options['chunk_size'])
+
+        for stats in run_parallel(dump, aliases, options['workers']):
+            if stats['error']:
+                self.stderr.write(u"{0}: {1}\n".format(stats['alias'], stats['error']))
+                continue
+            self.stderr.write(format_stats(stats) + u"\n")
+            # print the path so we can then use this in other scripts
+            self.stdout.write(stats['path'] + u"\n")
+
+    def handle_tables(self, alias, backup_dir, options):
+        "Dump alias one table per file, resuming options['resume'] if given"
+        db = settings.DATABASES[alias]
+        if get_table_dump_command(db, '') is None:
+            self.stderr.write(u"{0}: Unsupported database backend {1}\n".format(alias, db['ENGINE']))
+            return
+
+        dump_dir = options['resume'] or u"{0}/{1}.{2}.tables".format(
             backup_dir,
-            db['NAME'],
-            datetime.now().strftime('%Y%m%d-%H%M')
+            os.path.basename(db['NAME']),
+            datetime.now().strftime('%Y%m%d-%H%M'),
             )
+        if not os.path.exists(dump_dir):
+            os.makedirs(dump_dir)
 
-        MYSQL_BACKENDS = ('django.db.backends.mysql', )
-        PG_BACKENDS = ('django.db.backends.postgres_psycopg', )
+        manifest = Manifest(dump_dir, alias, db['ENGINE'])
+        tables = [t for t in connections[alias].introspection.table_names()
+                  if not manifest.is_done(t)]
 
-        if db_type in MYSQL_BACKENDS:
-            command = u"mysqldump -u {USER} -p{PASSWORD} {NAME}".format(**db)
-        elif db_type in PG_BACKENDS:
-            command = u"export PGPASSWORD='{PASSWORD}' && pg_dump -Fc -U {USER} {NAME}".format(**db)
-        else:
-            self.stderr.write("Unsupported database backend\n")
-            return None
+        start = time.time()
+        rows = bytes_in = 0
+        with exported_snapshot(alias) as snapshot:
+            def dump(table):
+                return dump_table(alias, table, dump_dir, options['compression'],
+                                  options['chunk_size'], snapshot)
+
+            for entry in run_parallel(dump, tables, options['parallel'] or options['workers']):
+                if entry['error']:
+                    self.stderr.write(u"{0}.{1}: {2}\n".format(alias, entry['table'], entry['error']))
+                    continue
+                manifest.add(entry)
+                rows += entry['rows']
+                bytes_in += entry['bytes_in']
+                self.stderr.write(u"{0}.{1}\n".format(alias, format_table_stats(entry)))
+
+        seconds = (time.time() - start) or 1e-9
+        self.stderr.write(u"{0}: {1} tables, {2} rows in {3:.1f}s ({4:.0f} rows/s, {5:.1f} MB/s)\n".format(
+            alias, len(tables), rows, seconds, rows / seconds, bytes_in / 1048576.0 / seconds))
+        self.stdout.write(dump_dir + u"\n")
+
+    def handle_portable(self, alias, backup_dir, options):
+        "Dump alias with portable_dump, reporting rows/s for each model"
+        dump_dir = u"{0}/{1}.{2}.portable".format(
+            backup_dir,
+            os.path.basename(settings.DATABASES[alias]['NAME']),
+            datetime.now().strftime('%Y%m%d-%H%M'),
+            )
+
+        def progress(entry):
+            self.stderr.write(u"{0}.{1}: {2} rows in {3:.1f}s ({4:.0f} rows/s)\n".format(
+                alias, entry['model'], entry['rows'], entry['seconds'],
+                entry['rows'] / (entry['seconds'] or 1e-9)))
 
-        # now run it
-        with open(backup_path, 'w') as backup_f:
-            p = subprocess.Popen(
-                    command,
-                    shell=True,
-                    stdout=backup_f,
-                    stderr=backup_f,
-                    )
-
-        # print the path so we can then use this in other scripts
-        self.stdout.write(backup_path)
+        portable_dump.dump_models(dump_dir, alias, options['batch_size'], progress=progress)
+        self.stdout.write(dump_dir + u"\n")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from djunk_drawer.views import prerender_markdown
+
+
+class Command(BaseCommand):
+    """
+    Render every markdown file under settings.MARKDOWN_ROOT into the
+    cache, so MarkdownViews don't have to on their first request.
+    """
+    def handle(self, *args, **options):
+        for path in prerender_markdown():
+            self.stdout.write(path + u"\n")
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from djunk_drawer.management.options import add_options, make_option_list
+from djunk_drawer.profiling import FIELDS, load_snapshots, summarize
+
+OPTIONS = (
+    (('--dir', ), dict(dest='directory', default=None,
+                       help='Snapshot directory (default settings.PROFILING_DIR).')),
+    (('--sort', ), dict(dest='sort', default='total',
+                        help='Field to sort by p95 of: {0}.'.format(', '.join(FIELDS)))),
+    (('--limit', ), dict(dest='limit', type=int, default=50,
+                         help='Number of views to show.')),
+    )
+
+
+class Command(BaseCommand):
+    """
+    Per-view percentiles from ProfilingMiddleware, merged across every
+    process that wrote a snapshot to PROFILING_DIR.
+
+    Usage: manage.py profilestats [--dir DIR] [--sort field] [--limit N]
+
+    Times are ms. Views are sorted by p95 of --sort (default total).
+    """
+    option_list = make_option_list(OPTIONS)
+
+    def add_arguments(self, parser):
+        add_options(parser, OPTIONS)
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or getattr(settings, 'PROFILING_DIR', None)
+        if not directory:
+            raise CommandError("Set PROFILING_DIR or pass --dir")
+        if options['sort'] not in FIELDS:
+            raise CommandError(u"--sort must be one of {0}".format(', '.join(FIELDS)))
+
+        summary = summarize(load_snapshots(directory))
+        if not summary:
+            raise CommandError(u"No profiling snapshots in {0}".format(directory))
+
+        views = sorted(summary.items(), key=lambda item: -item[1][options['sort']]['p95'])
+        self.stdout.write(u"{0:>7} {1:>23} {2:>23} {3:>12} {4:>10} {5:>7}  {6}\n".format(
+            'count', 'total p50/p95/p99', 'render p50/p95/p99', 'sql p50/p95', 'sql ms p95',
+            'cache', 'view'))
+        for view, stats in views[:options['limit']]:
+            self.stdout.write(u"{0:>7} {1:>23} {2:>23} {3:>12} {4:>10.1f} {5:>7.1f}  {6}\n".format(
+                stats['count'],
+                u"{p50:.1f}/{p95:.1f}/{p99:.1f}".format(**stats['total']),
+                u"{p50:.1f}/{p95:.1f}/{p99:.1f}".format(**stats['render']),
+                u"{p50:.0f}/{p95:.0f}".format(**stats['sql_count']),
+                stats['sql_time']['p95'],
+                stats['cache_calls']['mean'],
+                view))
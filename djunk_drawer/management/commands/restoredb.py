@@ -0,0 +1,99 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from djunk_drawer import portable_dump
+from djunk_drawer.management.commands.dumpdb import (
+    CHUNK_SIZE, SQLITE_BACKENDS, Manifest, get_table_restore_command, restore_table, run_parallel)
+from djunk_drawer.management.options import USE_ARGPARSE, add_options, make_option_list
+
+OPTIONS = (
+    (('--database', ), dict(dest='database', default='default',
+                            help='Database alias to restore into.')),
+    (('--parallel', ), dict(dest='parallel', type=int, default=2,
+                            help='Number of tables to restore at a time.')),
+    (('--chunk-size', ), dict(dest='chunk_size', type=int, default=CHUNK_SIZE,
+                              help='Bytes fed to the restore command per chunk.')),
+    (('--batch-size', ), dict(dest='batch_size', type=int, default=portable_dump.CHUNK_SIZE,
+                              help='Rows per bulk_create transaction for portable dumps.')),
+    )
+
+
+class Command(BaseCommand):
+    """
+    Restore a per-table dump made with `dumpdb --parallel N`, or a
+    `dumpdb --portable` dump.
+
+    Usage: manage.py restoredb <dump dir> [--database alias] [--parallel N]
+
+    Tables are restored N at a time. Every file is checked against the
+    checksum in the dump's manifest.json before it's loaded.
+
+    Tables are restored in no particular order, so restore into an empty
+    database and expect foreign keys between tables to be checked only
+    once everything is loaded (or use --parallel 1 and sort it out).
+    SQLite only allows one writer, so sqlite dumps are always restored
+    one table at a time.
+    Portable dumps are loaded one model at a time in foreign key order,
+    --batch-size rows per transaction, into a freshly migrated database.
+    Rows migrate already created in those tables (content types,
+    permissions...) are deleted first.
+    """
+    if not USE_ARGPARSE:
+        args = '<dump dir>'
+    option_list = make_option_list(OPTIONS)
+
+    def add_arguments(self, parser):
+        parser.add_argument('args', nargs='*', metavar='dump dir')
+        add_options(parser, OPTIONS)
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Usage: restoredb <dump dir>")
+        dump_dir = args[0]
+        alias = options['database']
+        if alias not in settings.DATABASES:
+            raise CommandError(u"Unknown database {0}".format(alias))
+
+        manifest = Manifest(dump_dir)
+        if manifest.data.get('format') == 'portable':
+            return self.handle_portable(dump_dir, alias, options)
+
+        if get_table_restore_command(settings.DATABASES[alias]) is None:
+            raise CommandError(u"Unsupported database backend {0}".format(
+                settings.DATABASES[alias]['ENGINE']))
+        if not manifest.tables:
+            raise CommandError(u"No tables in {0}".format(manifest.path))
+
+        parallel = options['parallel']
+        if settings.DATABASES[alias]['ENGINE'] in SQLITE_BACKENDS:
+            parallel = 1
+
+        def restore(entry):
+            start = time.time()
+            error = restore_table(alias, entry, dump_dir, options['chunk_size'])
+            return entry, error, time.time() - start
+
+        start = time.time()
+        rows = failed = 0
+        for entry, error, seconds in run_parallel(restore, list(manifest.tables.values()), parallel):
+            if error:
+                failed += 1
+                self.stderr.write(u"{0}: {1}\n".format(entry['table'], error))
+                continue
+            rows += entry['rows']
+            self.stderr.write(u"{0}: {1} rows in {2:.1f}s\n".format(entry['table'], entry['rows'], seconds))
+
+        seconds = (time.time() - start) or 1e-9
+        self.stderr.write(u"{0} tables, {1} rows in {2:.1f}s ({3:.0f} rows/s)\n".format(
+            len(manifest.tables) - failed, rows, seconds, rows / seconds))
+        if failed:
+            raise CommandError(u"{0} tables failed to restore".format(failed))
+
+    def handle_portable(self, dump_dir, alias, options):
+        def progress(entry, seconds):
+            self.stderr.write(u"{0}: {1} rows in {2:.1f}s ({3:.0f} rows/s)\n".format(
+                entry['model'], entry['rows'], seconds, entry['rows'] / (seconds or 1e-9)))
+
+        portable_dump.restore_models(dump_dir, alias, options['batch_size'], progress=progress)
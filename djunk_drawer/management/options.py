@@ -0,0 +1,35 @@
+"""
+Command line options that work on every django we support. Django 1.8
+added add_arguments (argparse) and 1.10 dropped optparse's option_list,
+so commands list their options once, as (args, kwargs) pairs:
+
+    OPTIONS = (
+        (('--workers', ), dict(dest='workers', type=int, default=2, help='...')),
+    )
+
+    class Command(BaseCommand):
+        option_list = make_option_list(OPTIONS)
+
+        def add_arguments(self, parser):
+            add_options(parser, OPTIONS)
+
+Stick to kwargs both libraries understand: dest, default, help, action
+(store_true, append), choices and type (int, which optparse takes too).
+"""
+from django.core.management.base import BaseCommand
+
+USE_ARGPARSE = hasattr(BaseCommand, 'add_arguments')
+
+
+def make_option_list(options):
+    "BaseCommand.option_list plus options before Django 1.8, () after"
+    if USE_ARGPARSE:
+        return ()
+    from optparse import make_option
+    return BaseCommand.option_list + tuple(make_option(*args, **kwargs) for args, kwargs in options)
+
+
+def add_options(parser, options):
+    "Add options to an argparse parser, from add_arguments"
+    for args, kwargs in options:
+        parser.add_argument(*args, **kwargs)
@@ -1,8 +1,70 @@
+import random
 import re
+import threading
+import time
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db import connections
 from django.utils.cache import add_never_cache_headers
+from django.utils.functional import empty
+
+from djunk_drawer.db import clear_identity_map, start_identity_map
+from djunk_drawer.profiling import get_profiler
+from djunk_drawer.stats import get_stats
+from djunk_drawer.utils import LRUCache
+
+
+# Global inline flags like (?i) would apply to the whole alternation (or be
+# an error, on py3.11+), and numeric backreferences would point at the
+# wrong group once groups are renumbered
+UNSHAREABLE = re.compile(r'\(\?[aiLmsux]+\)|\\[1-9]')
+
+
+def compile_any(patterns):
+    """
+    Compile a list of regex strings into as few regexes as possible, each
+    an alternation of several patterns, so "does any pattern match?" is a
+    single regex call instead of a loop over every pattern.
+
+    Returns a tuple of compiled regexes; a path matches if any of them
+    match. Patterns with inline flags or numeric backreferences get a
+    regex of their own, and patterns that still can't share a regex (too
+    many groups, clashing group names) get split into smaller batches.
+    """
+    patterns = list(patterns)
+    alone = [p for p in patterns if UNSHAREABLE.search(p)]
+    if alone:
+        shared = [p for p in patterns if not UNSHAREABLE.search(p)]
+        return tuple(re.compile(p) for p in alone) + compile_any(shared)
+    if len(patterns) < 2:
+        return tuple(re.compile(p) for p in patterns)
+    try:
+        return (re.compile('|'.join('(?:{0})'.format(p) for p in patterns)), )
+    except (re.error, AssertionError, OverflowError):
+        # py2's re raises AssertionError past 100 groups
+        half = len(patterns) // 2
+        return compile_any(patterns[:half]) + compile_any(patterns[half:])
+
+
+def match_any(regexes, path):
+    for regex in regexes:
+        if regex.match(path):
+            return True
+    return False
+
+
+def user_is_anonymous_without_session(request):
+    """
+    True if we can tell request.user is anonymous without loading it.
+
+    With session auth, a request without a session cookie can't have a
+    logged in user, unless something this request already replaced or
+    evaluated the lazy request.user (i.e. a login view called login()).
+    """
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return False
+    return getattr(request.user, '_wrapped', None) is empty
 
 
 class RequireLoginMiddleware(object):
@@ -27,34 +89,247 @@ class RequireLoginMiddleware(object):
 
     LOGIN_REQUIRED_URLS_EXCEPTIONS is, conversely, where you explicitly
     define any exceptions (like login and logout URLs).
+
+    Each list of patterns is compiled into a combined regex (see
+    compile_any), and the decision for each path is kept in an LRU cache
+    of LOGIN_REQUIRED_URLS_CACHE_SIZE paths (default 1000). The path is
+    checked before request.user, so requests for paths that don't need a
+    login never load the user or session at all.
+
+    Reports login_required.calls, .cache_misses, .match_time (ms) and
+    .session_skipped to djunk_drawer.stats.
     """
     def __init__(self):
-        self.required = tuple([re.compile(url) for url in settings.LOGIN_REQUIRED_URLS])
-        self.exceptions = tuple([re.compile(url) for url in settings.LOGIN_REQUIRED_URLS_EXCEPTIONS])
+        self.required = compile_any(settings.LOGIN_REQUIRED_URLS)
+        self.exceptions = compile_any(settings.LOGIN_REQUIRED_URLS_EXCEPTIONS)
+        self.decisions = LRUCache(getattr(settings, 'LOGIN_REQUIRED_URLS_CACHE_SIZE', 1000))
+
+    def requires_login(self, path):
+        "True if path matches a required pattern and no exception"
+        decision = self.decisions.get(path)
+        if decision is None:
+            stats = get_stats()
+            start = time.time()
+            # An exception match wins over a required match
+            decision = (not match_any(self.exceptions, path)
+                        and match_any(self.required, path))
+            stats.timing('login_required.match_time', (time.time() - start) * 1000)
+            stats.incr('login_required.cache_misses')
+            self.decisions.set(path, decision)
+        return decision
 
     def process_view(self, request, view_func, view_args, view_kwargs):
-        # No need to process URLs if user already logged in
-        if request.user.is_authenticated():
+        get_stats().incr('login_required.calls')
+
+        # Non-matching requests don't care who the user is, so don't
+        # make them load it from the session
+        if not self.requires_login(request.path):
+            get_stats().incr('login_required.session_skipped')
             return None
 
-        # An exception match should immediately return None
-        for url in self.exceptions:
-            if url.match(request.path):
-                return None
+        # No need to wrap the view if user already logged in
+        if request.user.is_authenticated():
+            return None
 
         # Requests matching a restricted URL pattern are returned
         # wrapped with the login_required decorator
-        for url in self.required:
-            if url.match(request.path):
-                return login_required(view_func)(request, *view_args, **view_kwargs)
-
-        # Explicitly return None for all non-matching requests
-        return None
+        return login_required(view_func)(request, *view_args, **view_kwargs)
 
 
 class AuthSetsNoCacheHeadersMiddleware(object):
-    "Set no-cache headers for logged in users"
+    """
+    Set no-cache headers for logged in users
+
+    Set AUTH_NO_CACHE_SKIP_SESSIONLESS = True to skip loading the user for
+    requests without a session cookie (see
+    user_is_anonymous_without_session). Only do this if users are only
+    ever authenticated through sessions.
+    """
+    def __init__(self):
+        self.skip_sessionless = getattr(settings, 'AUTH_NO_CACHE_SKIP_SESSIONLESS', False)
+
     def process_response(self, request, response):
-        if hasattr(request, 'user') and request.user.is_authenticated():
+        if not hasattr(request, 'user'):
+            return response
+        if self.skip_sessionless and user_is_anonymous_without_session(request):
+            get_stats().incr('no_cache.session_skipped')
+            return response
+        if request.user.is_authenticated():
             add_never_cache_headers(response)
         return response
+
+
+class IdentityMapMiddleware(object):
+    """
+    Within a request, db.get_first_or_none and get_first_or_none_many
+    hand back the object they already found instead of querying again.
+    The map is thrown away at the end of the request.
+    """
+    def process_request(self, request):
+        start_identity_map()
+
+    def process_response(self, request, response):
+        clear_identity_map()
+        return response
+
+    def process_exception(self, request, exception):
+        clear_identity_map()
+
+
+# The profile being recorded in this thread, for the cache call wrappers
+_profiling = threading.local()
+
+CACHE_METHODS = ('get', 'set', 'add', 'delete', 'get_many', 'set_many',
+                 'delete_many', 'incr', 'decr', 'has_key')
+
+
+def count_cache_calls(cache):
+    "Wrap cache's methods to count calls made while a request is profiled. Idempotent."
+    if getattr(cache, '_profiling_wrapped', False):
+        return
+    for name in CACHE_METHODS:
+        method = getattr(cache, name, None)
+        if method is not None:
+            setattr(cache, name, _counting(method))
+    cache._profiling_wrapped = True
+
+
+def _counting(method):
+    def wrapper(*args, **kwargs):
+        profile = getattr(_profiling, 'current', None)
+        if profile is not None:
+            profile.cache_calls += 1
+        return method(*args, **kwargs)
+    return wrapper
+
+
+def all_caches():
+    try:
+        from django.core.cache import caches
+    except ImportError:  # Django < 1.7
+        from django.core.cache import cache
+        return [cache]
+    return [caches[alias] for alias in settings.CACHES]
+
+
+class RequestProfile(object):
+    "What's been measured so far of one sampled request"
+    def __init__(self):
+        self.start = time.time()
+        self.view_name = '(unresolved)'
+        self.view_start = None
+        self.view_end = None
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.cache_calls = 0
+        self.query_logs = {}  # alias: len(connection.queries) at start
+        self.cprofile = None
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += (time.time() - start) * 1000
+            self.sql_count += 1
+
+    def start_sql(self):
+        for connection in connections.all():
+            if hasattr(connection, 'execute_wrappers'):
+                connection.execute_wrappers.append(self.execute_wrapper)
+            else:  # Django < 2.0: log queries, like DEBUG does, and read the log
+                self.query_logs[connection.alias] = len(connection.queries)
+                if hasattr(connection, 'force_debug_cursor'):
+                    connection.force_debug_cursor = True
+                else:
+                    connection.use_debug_cursor = True
+
+    def stop_sql(self):
+        for connection in connections.all():
+            if hasattr(connection, 'execute_wrappers'):
+                if self.execute_wrapper in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(self.execute_wrapper)
+            elif connection.alias in self.query_logs:
+                queries = list(connection.queries)[self.query_logs[connection.alias]:]
+                self.sql_count += len(queries)
+                self.sql_time += sum(float(q['time']) for q in queries) * 1000
+                if hasattr(connection, 'force_debug_cursor'):
+                    connection.force_debug_cursor = False
+                else:
+                    connection.use_debug_cursor = None
+
+
+class ProfilingMiddleware(object):
+    """
+    Profile a sample of requests, per view. See djunk_drawer.profiling for
+    what's recorded and where it goes, and the profilestats command to see
+    it. Settings:
+
+    PROFILING_SAMPLE_RATE = 0.01  fraction of requests to profile
+    PROFILING_CACHE = False       count cache calls (wraps each cache's methods)
+    PROFILING_CPROFILE = False    run sampled requests under cProfile, and
+                                  keep .prof dumps of the slowest in PROFILING_DIR
+
+    Put it first in MIDDLEWARE_CLASSES so its time covers the other
+    middlewares. Render time is only split out from view time for views
+    returning a TemplateResponse; other views render inside the view.
+    """
+    def __init__(self):
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.01)
+        self.cache = getattr(settings, 'PROFILING_CACHE', False)
+        self.cprofile = getattr(settings, 'PROFILING_CPROFILE', False)
+
+    def process_request(self, request):
+        if random.random() >= self.sample_rate:
+            return
+        profile = request._profile = RequestProfile()
+        if self.cache:
+            for cache in all_caches():
+                count_cache_calls(cache)
+            _profiling.current = profile
+        profile.start_sql()
+        if self.cprofile:
+            import cProfile
+            profile.cprofile = cProfile.Profile()
+            profile.cprofile.enable()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            profile.view_name = '{0}.{1}'.format(
+                view_func.__module__,
+                getattr(view_func, '__name__', type(view_func).__name__))
+            profile.view_start = time.time()
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            profile.view_end = time.time()
+        return response
+
+    def process_response(self, request, response):
+        profile = getattr(request, '_profile', None)
+        if profile is None:
+            return response
+        del request._profile
+        end = time.time()
+        if profile.cprofile is not None:
+            profile.cprofile.disable()
+        profile.stop_sql()
+        _profiling.current = None
+
+        total = (end - profile.start) * 1000
+        if profile.view_start is None:
+            view = render = 0.0
+        elif profile.view_end is None:
+            view, render = (end - profile.view_start) * 1000, 0.0
+        else:
+            view = (profile.view_end - profile.view_start) * 1000
+            render = (end - profile.view_end) * 1000
+
+        profiler = get_profiler()
+        profiler.record(profile.view_name, (
+            total, view, render, profile.sql_count, profile.sql_time, profile.cache_calls))
+        if profile.cprofile is not None and profiler.is_slowest(total):
+            profiler.save_profile(profile.cprofile, profile.view_name, total)
+        return response
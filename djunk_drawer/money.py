@@ -0,0 +1,156 @@
+"""
+Fixed-point money math for when make_decimal in a loop is too slow.
+
+Amounts are stored as integers scaled by 10 ** places (cents, for
+places=2) in a compact array, and all the math is integer math.
+Decimals only come in and out at the edges:
+
+    amounts = FixedPointArray(['19.99', 5, Decimal('0.125')])
+    amounts.sum()                      # Decimal('25.11')
+    amounts.multiply('1.07').to_decimals()
+    allocate('100.00', [1, 1, 1])      # 33.34, 33.33, 33.33
+
+Conversions in and rounding match utils.make_decimal exactly (round half
+even, the default decimal context).
+"""
+import numbers
+from array import array
+from decimal import Decimal
+
+from djunk_drawer.utils import make_decimal
+
+try:
+    array('q')
+    TYPECODE = 'q'
+except ValueError:  # no long long arrays on py2; 'l' is 64 bits on most unixes
+    TYPECODE = 'l'
+
+
+def round_half_even(n, d):
+    "n / d rounded half to even, all integers, d > 0"
+    q, r = divmod(n, d)  # floors, so r is never negative
+    if 2 * r > d or (2 * r == d and q % 2):
+        q += 1
+    return q
+
+
+def to_scaled(amount, places=2):
+    "amount as an integer count of 10 ** -places, like make_decimal(amount, places)"
+    if isinstance(amount, numbers.Integral):
+        return amount * 10 ** places
+    return int(make_decimal(amount, places).scaleb(places))
+
+
+def to_fraction(factor):
+    "A Decimal-able factor as an exact (numerator, denominator) pair of ints"
+    sign, digits, exp = Decimal(factor).as_tuple()
+    num = int(''.join(map(str, digits)) or 0) * (-1 if sign else 1)
+    if exp >= 0:
+        return num * 10 ** exp, 1
+    return num, 10 ** -exp
+
+
+class FixedPointArray(object):
+    """
+    A list of money amounts with `places` decimal places, stored as scaled
+    integers in an array.array. Indexing and iterating give Decimals.
+    """
+    def __init__(self, amounts=(), places=2):
+        self.places = places
+        self.data = array(TYPECODE, [to_scaled(a, places) for a in amounts])
+
+    @classmethod
+    def from_scaled(cls, values, places=2):
+        "Build from integers already scaled by 10 ** places"
+        result = cls(places=places)
+        result.data = array(TYPECODE, values)
+        return result
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        return Decimal(self.data[i]).scaleb(-self.places)
+
+    def __iter__(self):
+        return iter(self.to_decimals())
+
+    def __repr__(self):
+        return 'FixedPointArray({0!r}, places={1})'.format(self.to_decimals(), self.places)
+
+    def append(self, amount):
+        self.data.append(to_scaled(amount, self.places))
+
+    def extend(self, amounts):
+        self.data.extend(to_scaled(a, self.places) for a in amounts)
+
+    def to_decimals(self):
+        exp = -self.places
+        return [Decimal(v).scaleb(exp) for v in self.data]
+
+    def to_numpy(self):
+        "The scaled integers as a numpy int64 array, sharing memory where possible"
+        import numpy
+        return numpy.frombuffer(self.data, dtype='i{0}'.format(self.data.itemsize)).astype('int64', copy=False)
+
+    def sum(self):
+        "Exact total, as a Decimal"
+        return Decimal(sum(self.data)).scaleb(-self.places)
+
+    def __add__(self, other):
+        if other.places != self.places or len(other) != len(self):
+            raise ValueError('Can only add FixedPointArrays of the same length and places')
+        return self.from_scaled([a + b for a, b in zip(self.data, other.data)], self.places)
+
+    def multiply(self, factor):
+        "Every amount times factor, each rounded half even to self.places"
+        num, den = to_fraction(factor)
+        if den == 1:
+            return self.from_scaled([v * num for v in self.data], self.places)
+        return self.from_scaled([round_half_even(v * num, den) for v in self.data], self.places)
+
+    def round(self, places):
+        "Every amount rounded half even to `places` decimal places"
+        if places >= self.places:
+            scale = 10 ** (places - self.places)
+            return self.from_scaled([v * scale for v in self.data], places)
+        scale = 10 ** (self.places - places)
+        return self.from_scaled([round_half_even(v, scale) for v in self.data], places)
+
+
+def allocate(amount, ratios, places=2):
+    """
+    Split amount into len(ratios) parts proportional to ratios, in whole
+    units of 10 ** -places, that add up to exactly amount. Leftover units
+    go to the parts with the biggest remainders (ties to the earliest).
+    A negative amount is split like its absolute value, so
+    allocate(-x, ratios) is -allocate(x, ratios). Returns a FixedPointArray.
+    """
+    total = to_scaled(amount, places)
+    sign = -1 if total < 0 else 1
+    total = abs(total)
+    fractions = [to_fraction(r) for r in ratios]
+    # put every ratio over a common denominator so it's all integer math
+    common = 1
+    for num, den in fractions:
+        common = common * den // gcd(common, den)
+    weights = [num * (common // den) for num, den in fractions]
+    weight_total = sum(weights)
+    if weight_total <= 0:
+        raise ValueError('ratios must add up to more than zero')
+
+    parts = []
+    remainders = []
+    for i, weight in enumerate(weights):
+        part, remainder = divmod(total * weight, weight_total)
+        parts.append(part)
+        remainders.append((-remainder, i))
+    for remainder, i in sorted(remainders)[:total - sum(parts)]:
+        parts[i] += 1
+    return FixedPointArray.from_scaled([sign * part for part in parts], places)
+
+
+def gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
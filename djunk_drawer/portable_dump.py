@@ -0,0 +1,214 @@
+"""
+A backend-agnostic dump/restore that only talks to the db through the ORM.
+
+A dump is a directory with one gzipped JSON-lines file per model plus a
+manifest.json. The first line of each model file is the list of field
+attnames, every following line is one row as a list of values:
+
+    dump_models('/backups/mysite.portable')
+    restore_models('/backups/mysite.portable', using='other')
+
+Rows are read in pk order with keyset pagination (pk > last pk seen),
+chunk_size at a time, so memory use stays flat however big a table is.
+Restores go through bulk_create, one transaction per chunk, with models
+loaded in foreign key order.
+
+Restore into a database that's been migrated (so the tables exist) but
+not otherwise used. Migrating fills in some tables itself (content types,
+permissions, sites...), so any rows already in the tables being restored
+are deleted first; see clear_models.
+"""
+import gzip
+import json
+import os
+import time
+
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router, transaction
+
+try:
+    from django.apps import apps
+    get_models, get_model = apps.get_models, apps.get_model
+except ImportError:  # Django < 1.7
+    from django.db.models import get_models, get_model
+
+atomic = getattr(transaction, 'atomic', None) or transaction.commit_on_success
+
+
+MANIFEST_NAME = 'manifest.json'
+CHUNK_SIZE = 1000
+
+
+def allow_model(using, model):
+    if hasattr(router, 'allow_migrate_model'):
+        return router.allow_migrate_model(using, model)
+    return router.allow_syncdb(using, model)
+
+
+def dumpable_models(using='default'):
+    "Concrete, managed models (including m2m through tables) routed to `using`"
+    return [m for m in get_models(include_auto_created=True)
+            if m._meta.managed and not m._meta.proxy and allow_model(using, m)]
+
+
+def model_label(model):
+    return u"{0}.{1}".format(model._meta.app_label, model._meta.object_name)
+
+
+def sort_models(models):
+    "Order models so every model comes after the models its foreign keys point at"
+    pending = list(models)
+    done = []
+    while pending:
+        for model in pending:
+            deps = set(f.rel.to for f in model._meta.local_fields
+                       if getattr(f, 'rel', None) and f.rel.to is not model)
+            if not deps.intersection(pending):
+                break
+        else:
+            model = pending[0]  # a cycle, so just pick one
+        pending.remove(model)
+        done.append(model)
+    return done
+
+
+def iter_chunks(model, using='default', chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of up to chunk_size rows of model as lists of field values,
+    in pk order, paging on pk rather than OFFSET so each query is cheap.
+    """
+    fields = model._meta.local_fields
+    names = [f.name for f in fields]
+    pk_index = [f.primary_key for f in fields].index(True)
+    qs = model._base_manager.using(using).order_by('pk').values_list(*names)
+    last_pk = None
+    while True:
+        chunk = qs.filter(pk__gt=last_pk) if last_pk is not None else qs
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1][pk_index]
+
+
+def dump_model(model, path, using='default', chunk_size=CHUNK_SIZE):
+    "Dump one model to path, returning its manifest entry"
+    start = time.time()
+    rows = 0
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    with gzip.open(path, 'wb') as f:
+        f.write(encoder.encode([fld.attname for fld in model._meta.local_fields]).encode('utf-8') + b'\n')
+        for chunk in iter_chunks(model, using, chunk_size):
+            f.write(b''.join(encoder.encode(row).encode('utf-8') + b'\n' for row in chunk))
+            rows += len(chunk)
+    return {'model': model_label(model), 'file': os.path.basename(path),
+            'rows': rows, 'seconds': time.time() - start}
+
+
+def dump_models(dump_dir, using='default', chunk_size=CHUNK_SIZE, models=None, progress=None):
+    """
+    Dump every model (or just `models`) in db `using` into dump_dir.
+
+    progress, if given, is called with each model's manifest entry as it
+    finishes. Returns the manifest dict.
+    """
+    if not os.path.exists(dump_dir):
+        os.makedirs(dump_dir)
+    manifest = {'format': 'portable', 'alias': using, 'models': []}
+    for model in sort_models(models or dumpable_models(using)):
+        path = os.path.join(dump_dir, u"{0}.jsonl.gz".format(model_label(model)))
+        entry = dump_model(model, path, using, chunk_size)
+        manifest['models'].append(entry)
+        if progress:
+            progress(entry)
+    with open(os.path.join(dump_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_model(model, path, using='default', chunk_size=CHUNK_SIZE):
+    "Restore one model file, a transaction per chunk. Returns rows loaded."
+    rows = 0
+    with gzip.open(path, 'rb') as f:
+        attnames = json.loads(next(f).decode('utf-8'))
+        by_attname = dict((fld.attname, fld) for fld in model._meta.local_fields)
+        fields = [by_attname[a] for a in attnames]
+        # bulk_create can't handle multi-table inheritance, save those
+        # the way loaddata does instead
+        has_parents = bool(model._meta.parents)
+        chunk = []
+
+        def flush():
+            with atomic(using=using):
+                if has_parents:
+                    for obj in chunk:
+                        obj.save_base(raw=True, using=using)
+                else:
+                    model._base_manager.db_manager(using).bulk_create(chunk)
+
+        for line in f:
+            values = json.loads(line.decode('utf-8'))
+            chunk.append(model(**dict(
+                (fld.attname, fld.to_python(v) if v is not None else None)
+                for fld, v in zip(fields, values))))
+            if len(chunk) >= chunk_size:
+                flush()
+                rows += len(chunk)
+                chunk = []
+        if chunk:
+            flush()
+            rows += len(chunk)
+    return rows
+
+
+def clear_models(models, using='default'):
+    """
+    Delete every row of models (in reverse foreign key order, so children
+    go first) that have any, i.e. what post_migrate created in a freshly
+    migrated db. Returns the models cleared.
+    """
+    connection = connections[using]
+    cleared = [m for m in reversed(sort_models(models))
+               if m._base_manager.using(using).exists()]
+    if cleared:
+        with atomic(using=using):
+            cursor = connection.cursor()
+            for model in cleared:
+                cursor.execute(u"DELETE FROM {0}".format(connection.ops.quote_name(model._meta.db_table)))
+    return cleared
+
+
+def restore_models(dump_dir, using='default', chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Load a dump_models directory into db `using`, which should be freshly
+    migrated. Rows already in the dumped models' tables are replaced.
+
+    progress, if given, is called with (entry, seconds) after each model.
+    Returns the manifest dict.
+    """
+    with open(os.path.join(dump_dir, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+
+    connection = connections[using]
+    models = [get_model(*entry['model'].split('.')) for entry in manifest['models']]
+    clear_models(models, using)
+    loaded = []
+    with connection.constraint_checks_disabled():
+        for entry, model in zip(manifest['models'], models):
+            start = time.time()
+            load_model(model, os.path.join(dump_dir, entry['file']), using, chunk_size)
+            loaded.append(model)
+            if progress:
+                progress(entry, time.time() - start)
+    connection.check_constraints(table_names=[m._meta.db_table for m in loaded])
+
+    # bump sequences past the pks we just inserted, as loaddata does
+    sequence_sql = connection.ops.sequence_reset_sql(no_style(), loaded)
+    if sequence_sql:
+        with atomic(using=using):
+            cursor = connection.cursor()
+            for sql in sequence_sql:
+                cursor.execute(sql)
+    return manifest
+
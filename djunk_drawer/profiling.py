@@ -0,0 +1,174 @@
+"""
+In-process request profiling, for finding slow views in production
+without an APM. See middleware.ProfilingMiddleware, which feeds this.
+
+For a sample of requests we record, per view:
+
+    total, view and template render time (ms), SQL query count and time
+    (ms), and cache calls
+
+The last PROFILING_SAMPLES (default 1000) samples of each view are kept
+in a ring buffer, for at most PROFILING_MAX_VIEWS (default 500) views, so
+memory stays bounded however long the process lives. summary() gives
+p50/p95/p99 per view.
+
+Each process writes its samples to PROFILING_DIR/profile-<pid>.json every
+PROFILING_SNAPSHOT_INTERVAL seconds (default 60), from a background
+thread, and on exit; the profilestats management command merges those
+into one table.
+"""
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+
+FIELDS = ('total', 'view', 'render', 'sql_count', 'sql_time', 'cache_calls')
+
+
+def percentile(sorted_values, p):
+    "Nearest-rank p'th percentile (0-100) of an already sorted list"
+    if not sorted_values:
+        return None
+    rank = int(round(p / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[rank]
+
+
+def summarize(samples_by_view):
+    """
+    {view: [sample tuple, ...]} -> {view: {'count': n, field: {'p50': ..,
+    'p95': .., 'p99': .., 'mean': ..}}} for each of FIELDS
+    """
+    summary = {}
+    for view, samples in samples_by_view.items():
+        if not samples:
+            continue
+        stats = summary[view] = {'count': len(samples)}
+        for i, field in enumerate(FIELDS):
+            values = sorted(sample[i] for sample in samples)
+            stats[field] = {
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+                'mean': sum(values) / float(len(values)),
+            }
+    return summary
+
+
+class Profiler(object):
+    "The per-process ring buffers of samples, by view"
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.maxlen = getattr(settings, 'PROFILING_SAMPLES', 1000)
+        self.max_views = getattr(settings, 'PROFILING_MAX_VIEWS', 500)
+        self.directory = getattr(settings, 'PROFILING_DIR', None)
+        self.interval = getattr(settings, 'PROFILING_SNAPSHOT_INTERVAL', 60)
+        self.slowest_count = getattr(settings, 'PROFILING_CPROFILE_SLOWEST', 10)
+        self.views = {}
+        self.slowest = []  # [(total ms, path of its .prof dump)], fastest first
+        self.last_snapshot = time.time()
+
+    def record(self, view, sample):
+        with self.lock:
+            samples = self.views.get(view)
+            if samples is None:
+                if len(self.views) >= self.max_views:
+                    return
+                samples = self.views[view] = deque(maxlen=self.maxlen)
+            samples.append(sample)
+
+            # only one thread gets to start each snapshot
+            now = time.time()
+            snapshot_due = self.directory and now - self.last_snapshot > self.interval
+            if snapshot_due:
+                self.last_snapshot = now
+        if snapshot_due:
+            thread = threading.Thread(target=self.write_snapshot, name='profiling-snapshot')
+            thread.daemon = True
+            thread.start()
+
+    def samples(self):
+        with self.lock:
+            return dict((view, list(samples)) for view, samples in self.views.items())
+
+    def summary(self):
+        return summarize(self.samples())
+
+    def snapshot_path(self):
+        return os.path.join(self.directory, 'profile-{0}.json'.format(os.getpid()))
+
+    def write_snapshot(self):
+        "Write our samples to PROFILING_DIR, atomically, for profilestats"
+        if not self.directory:
+            return
+        fd, tmp = tempfile.mkstemp(prefix='.profile-', suffix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'pid': os.getpid(), 'time': time.time(),
+                       'fields': FIELDS, 'views': self.samples()}, f)
+        os.rename(tmp, self.snapshot_path())
+
+    def is_slowest(self, ms):
+        "Would a request taking ms be one of the slowest_count slowest so far?"
+        with self.lock:
+            return (self.slowest_count > 0 and
+                    (len(self.slowest) < self.slowest_count or ms > self.slowest[0][0]))
+
+    def save_profile(self, profile, view, ms):
+        """
+        Dump a cProfile.Profile to PROFILING_DIR if it's still one of the
+        slowest, removing the dump it pushes out.
+        """
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, '{0}-{1}-{2}.prof'.format(
+            os.getpid(), view.replace(os.sep, '_'), int(ms)))
+        with self.lock:
+            if len(self.slowest) >= self.slowest_count:
+                if ms <= self.slowest[0][0]:
+                    return
+                removed = self.slowest.pop(0)[1]
+            else:
+                removed = None
+            self.slowest.append((ms, path))
+            self.slowest.sort()
+        profile.dump_stats(path)
+        if removed:
+            try:
+                os.remove(removed)
+            except OSError:
+                pass
+
+
+_profiler = None
+
+
+def get_profiler():
+    "This process's Profiler, created on first use"
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+        if _profiler.directory:
+            atexit.register(_profiler.write_snapshot)
+    return _profiler
+
+
+def load_snapshots(directory):
+    "Merge every process's snapshot in directory into {view: [sample, ...]}"
+    merged = {}
+    for path in sorted(glob.glob(os.path.join(directory, 'profile-*.json'))):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            continue  # half written, or not ours
+        if tuple(data.get('fields', ())) != FIELDS:
+            continue
+        for view, samples in data['views'].items():
+            merged.setdefault(view, []).extend(samples)
+    return merged
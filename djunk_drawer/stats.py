@@ -0,0 +1,106 @@
+"""
+Pluggable hot-path counters and timers, statsd style.
+
+Code that wants to be measured does:
+
+    from djunk_drawer.stats import get_stats
+    get_stats().incr('thing.calls')
+    get_stats().timing('thing.time', elapsed_ms)
+
+Which backend gets those is up to settings.DJUNK_STATS_BACKEND, a dotted
+path to a class with incr(name, count=1) and timing(name, ms) methods:
+
+    DJUNK_STATS_BACKEND = 'djunk_drawer.stats.LocalStats'   # in-process
+    DJUNK_STATS_BACKEND = 'djunk_drawer.stats.StatsdStats'  # statsd over UDP
+
+The default, NullStats, throws everything away.
+"""
+import socket
+import threading
+
+from django.conf import settings
+
+try:
+    from django.utils.module_loading import import_string
+except ImportError:  # Django < 1.7
+    from django.utils.importlib import import_module
+
+    def import_string(path):
+        module, name = path.rsplit('.', 1)
+        return getattr(import_module(module), name)
+
+
+class NullStats(object):
+    "Does nothing, cheaply"
+    def incr(self, name, count=1):
+        pass
+
+    def timing(self, name, ms):
+        pass
+
+
+class LocalStats(object):
+    """
+    Keeps counters and timings in memory, for tests, benchmarks or a
+    debug view. snapshot() returns
+    {'counters': {name: n}, 'timings': {name: (count, total_ms, max_ms)}}
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.timings = {}
+
+    def incr(self, name, count=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def timing(self, name, ms):
+        with self.lock:
+            n, total, most = self.timings.get(name, (0, 0.0, 0.0))
+            self.timings[name] = (n + 1, total + ms, max(most, ms))
+
+    def snapshot(self):
+        with self.lock:
+            return {'counters': dict(self.counters), 'timings': dict(self.timings)}
+
+
+class StatsdStats(object):
+    """
+    Sends to a statsd server over UDP, fire and forget.
+
+    Set STATSD_HOST (default localhost), STATSD_PORT (default 8125) and
+    STATSD_PREFIX (default 'djunk') in settings.
+    """
+    def __init__(self):
+        self.addr = (getattr(settings, 'STATSD_HOST', 'localhost'),
+                     getattr(settings, 'STATSD_PORT', 8125))
+        self.prefix = getattr(settings, 'STATSD_PREFIX', 'djunk')
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, stat):
+        try:
+            self.sock.sendto(u"{0}.{1}".format(self.prefix, stat).encode('utf-8'), self.addr)
+        except socket.error:
+            pass  # stats are never worth failing a request for
+
+    def incr(self, name, count=1):
+        self.send(u"{0}:{1}|c".format(name, count))
+
+    def timing(self, name, ms):
+        self.send(u"{0}:{1:.3f}|ms".format(name, ms))
+
+
+_stats = None
+
+
+def get_stats():
+    "The configured stats backend, created on first use"
+    global _stats
+    if _stats is None:
+        path = getattr(settings, 'DJUNK_STATS_BACKEND', None)
+        _stats = import_string(path)() if path else NullStats()
+    return _stats
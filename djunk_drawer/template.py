@@ -1,7 +1,80 @@
 import hashlib
+import os
+import time
 
+from django import db
+from django.conf import settings
 from django.core.cache import cache
-from django.utils.http import urlquote
+from django.template import Context, TemplateDoesNotExist, Variable
+from django.template.loader import get_template
+
+from djunk_drawer.stats import get_stats
+
+
+def find_template_path(template_name):
+    """
+    Path to the file the filesystem or app_directories loaders would load
+    for template_name, or None if it isn't a plain file on disk.
+
+    Handy for checking a template's mtime.
+    """
+    try:
+        template = get_template(template_name)
+    except TemplateDoesNotExist:
+        return None
+    # Django >= 1.8 backends wrap the compiled template, which knows its origin
+    origin = getattr(getattr(template, 'template', template), 'origin', None)
+    if origin is not None:
+        path = getattr(origin, 'name', None)
+        return path if path and os.path.isfile(path) else None
+
+    # Older djangos only set origin with TEMPLATE_DEBUG, but their loaders
+    # can be asked directly
+    from django.template.loaders import app_directories, filesystem
+    for loader in (filesystem.Loader(), app_directories.Loader()):
+        for path in loader.get_template_sources(template_name):
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+# template name: compiled template, for get_cached_template
+_templates = {}
+
+
+def get_cached_template(template_name):
+    """
+    loader.get_template, but only once per process, for code that renders
+    the same template lots of times per request (i.e. widgets).
+
+    Not cached when settings.DEBUG is on, so template edits still show up
+    in development.
+    """
+    if settings.DEBUG:
+        return get_template(template_name)
+    t = _templates.get(template_name)
+    if t is None:
+        t = _templates[template_name] = get_template(template_name)
+    return t
+
+
+def template_cache_key(fragment_name, *args):
+    """
+    The cache key django's {% cache %} tag uses for fragment_name with args
+
+    Django >= 1.6 exposes it as make_template_fragment_key. For older
+    djangos the method is taken directly from
+    django.templatetags.cache.CacheNode's render method. If this
+    ever breaks, look there for changes.
+    """
+    try:
+        from django.core.cache.utils import make_template_fragment_key
+    except ImportError:  # Django < 1.6
+        from django.utils.http import urlquote
+        hash = hashlib.md5(u':'.join([urlquote(x) for x in args]).encode('utf-8'))
+        return 'template.cache.{0}.{1}'.format(fragment_name, hash.hexdigest())
+    return make_template_fragment_key(fragment_name, args)
+
 
 def invalidate_template_cache(fragment_name, *args):
     """
@@ -14,12 +87,220 @@ def invalidate_template_cache(fragment_name, *args):
     In a view or a save method or a receiver, say, do this:
 
         invalidate_template_cache('user_links', user.pk)
-
-    The method for generating the cache key is taken directly from
-    django.templatetags.cache.CacheNode's render method. If this
-    ever breaks, look there for changes.
     """
-    hash = hashlib.md5(u':'.join([urlquote(x) for x in args]))
-    cache_key = 'template.cache.{0}.{1}'.format(fragment_name, hash.hexdigest())
+    cache_key = template_cache_key(fragment_name, *args)
     cache.delete(cache_key)
     return cache_key
+
+
+def invalidate_template_cache_many(fragments):
+    """
+    Invalidate many fragments with a single cache.delete_many. i.e.:
+
+        invalidate_template_cache_many([('user_links', u.pk) for u in users])
+
+    fragments is an iterable of (fragment_name, arg, arg...) tuples.
+    Returns the list of keys deleted.
+    """
+    cache_keys = [template_cache_key(f[0], *f[1:]) for f in fragments]
+    if cache_keys:
+        cache.delete_many(cache_keys)
+    return cache_keys
+
+
+def fragment_generation_key(fragment_name):
+    return 'template.cache.generation.{0}'.format(fragment_name)
+
+
+def get_fragment_generation(fragment_name):
+    """
+    Current generation number of fragment_name, for invalidating every
+    copy of a fragment at once. Add it to the fragment's vary_on args:
+
+        {% cache 600 user_links user.pk "user_links"|fragment_generation %}
+
+    then invalidate_fragment_family('user_links') bumps the number, so
+    every user's fragment gets a new key, without having to know (or
+    scan for) the old ones. The old ones just expire.
+    """
+    key = fragment_generation_key(fragment_name)
+    generation = cache.get(key)
+    if generation is None:
+        generation = start_generation(key)
+    return generation
+
+
+def start_generation(key):
+    # Start from the time in ms, not 1, so a generation that got evicted
+    # can't restart at a number whose old fragments are still cached.
+    # add() so two processes starting a family at once agree.
+    generation = int(time.time() * 1000)
+    cache.add(key, generation, None)
+    return cache.get(key, generation)
+
+
+def invalidate_fragment_family(fragment_name):
+    "Invalidate every copy of fragment_name keyed on its generation. O(1)."
+    key = fragment_generation_key(fragment_name)
+    try:
+        return cache.incr(key)
+    except ValueError:  # no generation yet, nothing cached to invalidate
+        return start_generation(key)
+
+
+def resolve(var, context):
+    "Resolve a CacheNode expire time or vary_on var, which are strings in older djangos"
+    if hasattr(var, 'resolve'):
+        return var.resolve(context)
+    return Variable(var).resolve(context)
+
+
+def get_fragment_cache(node, context):
+    """
+    The cache a {% cache %} node uses, like django's tag: the using="..."
+    cache if given, else a 'template_fragments' cache if there is one, else
+    the default. None (meaning the default) in djangos before using=.
+    """
+    try:
+        from django.core.cache import InvalidCacheBackendError, caches
+    except ImportError:  # Django < 1.7
+        return None
+    node = getattr(node, 'node', node)  # unwrap a FragmentCacheNode
+    cache_name = getattr(node, 'cache_name', None)
+    if cache_name:
+        return caches[resolve(cache_name, context)]
+    try:
+        return caches['template_fragments']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def render_fragment(fragment_name, args, expire_time, render, force=False,
+                    lease_time=30, wait=1.0, fragment_cache=None):
+    """
+    Get fragment_name/args from the cache like {% cache %} does, calling
+    render() to make and cache it on a miss.
+
+    Only one process renders a missing fragment at a time: the renderer
+    takes a lease (a cache.add'ed lock key, good for lease_time seconds)
+    and everyone else polls the cache for up to `wait` seconds for its
+    result before giving up and rendering it themselves. With force=True
+    it's rendered (and re-cached) even if already cached.
+
+    fragment_cache is the cache backend to use (see get_fragment_cache),
+    default django's cache.
+
+    Counts template_cache.<fragment>.hit, .miss and .waited, and times
+    .render_time, in djunk_drawer.stats.
+    """
+    stats = get_stats()
+    if fragment_cache is None:
+        fragment_cache = cache
+    key = template_cache_key(fragment_name, *args)
+    if not force:
+        value = fragment_cache.get(key)
+        if value is not None:
+            stats.incr('template_cache.{0}.hit'.format(fragment_name))
+            return value
+        stats.incr('template_cache.{0}.miss'.format(fragment_name))
+
+    lock_key = key + '.lock'
+    leased = fragment_cache.add(lock_key, 1, lease_time)
+    if not leased and not force:
+        deadline = time.time() + wait
+        while time.time() < deadline:
+            time.sleep(0.05)
+            value = fragment_cache.get(key)
+            if value is not None:
+                stats.incr('template_cache.{0}.waited'.format(fragment_name))
+                return value
+
+    try:
+        start = time.time()
+        value = render()
+        stats.timing('template_cache.{0}.render_time'.format(fragment_name),
+                     (time.time() - start) * 1000)
+        fragment_cache.set(key, value, expire_time)
+    finally:
+        if leased:
+            fragment_cache.delete(lock_key)
+    return value
+
+
+def _compiled_template(template_name):
+    t = get_template(template_name)
+    return getattr(t, 'template', t)  # unwrap newer djangos' backend templates
+
+
+def find_cache_node(template_name, fragment_name, template=None):
+    """
+    The {% cache %} node for fragment_name in template_name (or in the
+    compiled template, if given)
+    """
+    from django.templatetags.cache import CacheNode
+    from djunk_drawer.templatetags.djunk_cache import FragmentCacheNode
+    t = template or _compiled_template(template_name)
+    for node in t.nodelist.get_nodes_by_type((CacheNode, FragmentCacheNode)):
+        if node.fragment_name == fragment_name:
+            return node
+    raise ValueError(u"No {{% cache %}} fragment {0} in {1}".format(fragment_name, template_name))
+
+
+def render_nodelist(template, nodelist, context):
+    """
+    Render nodelist, a part of template, with context set up the way
+    template.render(context) would, so tags that need the template being
+    rendered (like {% include %} in Django >= 1.8) work.
+    """
+    render_context = context.render_context
+    if hasattr(render_context, 'push_state'):  # Django >= 1.11
+        with render_context.push_state(template):
+            with context.bind_template(template):
+                return nodelist.render(context)
+    render_context.push()
+    try:
+        if hasattr(context, 'bind_template'):  # Django >= 1.8
+            with context.bind_template(template):
+                return nodelist.render(context)
+        return nodelist.render(context)
+    finally:
+        render_context.pop()
+
+
+def warm_template_cache(template_name, fragment_name, args_list, context_func, workers=4):
+    """
+    Render and cache a {% cache %} fragment ahead of time for each args in
+    args_list, i.e. right after invalidating it, so the next requests
+    don't all miss at once. Rendering happens in a pool of `workers`
+    threads, one lease per key (see render_fragment).
+
+        def user_context(pk):
+            return {'user': User.objects.get(pk=pk)}
+
+        warm_template_cache('base.html', 'user_links', [(pk, ) for pk in pks], user_context)
+
+    context_func(*args) returns the context the fragment needs, which must
+    resolve its vary_on variables to args. Returns the list of keys set.
+    """
+    template = _compiled_template(template_name)
+    node = find_cache_node(template_name, fragment_name, template)
+
+    def warm(args):
+        try:
+            context = Context(context_func(*args))
+            render_fragment(fragment_name, args, resolve(node.expire_time_var, context),
+                            lambda: render_nodelist(template, node.nodelist, context), force=True,
+                            fragment_cache=get_fragment_cache(node, context))
+            return template_cache_key(fragment_name, *args)
+        finally:
+            # each worker thread got its own connections
+            for connection in db.connections.all():
+                connection.close()
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(warm, [tuple(args) for args in args_list])
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,43 @@
+"""
+A drop-in {% cache %} tag that adds stampede protection and hit/miss/
+render time stats (see djunk_drawer.template.render_fragment). Swap
+
+    {% load cache %}
+
+for
+
+    {% load djunk_cache %}
+
+and leave the {% cache %} tags as they are.
+"""
+from django import template
+from django.templatetags.cache import do_cache
+
+from djunk_drawer.template import get_fragment_cache, render_fragment, resolve
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    "Wraps django's CacheNode, keeping its parsing but not its rendering"
+    child_nodelists = ('nodelist', )
+
+    def __init__(self, node):
+        self.node = node
+        self.nodelist = node.nodelist
+        self.fragment_name = node.fragment_name
+        self.expire_time_var = node.expire_time_var
+
+    def render(self, context):
+        return render_fragment(
+            self.fragment_name,
+            [resolve(var, context) for var in self.node.vary_on],
+            resolve(self.expire_time_var, context),
+            lambda: self.nodelist.render(context),
+            fragment_cache=get_fragment_cache(self.node, context),
+            )
+
+
+@register.tag('cache')
+def do_fragment_cache(parser, token):
+    return FragmentCacheNode(do_cache(parser, token))
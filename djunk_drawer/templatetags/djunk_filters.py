@@ -1,7 +1,10 @@
 from django import template
-from django.core.urlresolvers import reverse, NoReverseMatch
+from django.utils.html import escape
 from django.utils.safestring import mark_safe
 
+from djunk_drawer.template import get_fragment_generation
+from djunk_drawer.url_cache import NoReverseMatch, cached_reverse, pk_reverser
+
 register = template.Library()
 
 
@@ -36,14 +39,52 @@ def linked_list(objects, url_name):
 
         {{ my_objects|linked_list:"my_objects_detail" }}
     """
+    url_for = pk_reverser(url_name)
     links = []
     for obj in objects:
-        url = reverse(url_name, args=[obj.pk])
-        links.append("<a href='{0}'>{1}</a>".format(
-                        url, unicode(obj)))
+        url = url_for(obj.pk)
+        links.append(u"<a href='{0}'>{1}</a>".format(url, obj))
     return mark_safe(", ".join(links))
 
 
+def iter_linked_list(queryset, url_name, field, chunk_size=1000):
+    """
+    Generator version of linked_list for huge querysets, i.e.:
+
+        StreamingHttpResponse(iter_linked_list(Thing.objects.all(), 'thing_detail', 'name'))
+
+    Only pk and `field` (the link text, escaped) are fetched, with
+    values_list, chunk_size rows at a time in pk order. So no model
+    instances (or queries in their __unicode__) and memory stays flat.
+    Yields html a link at a time.
+    """
+    url_for = pk_reverser(url_name)
+    qs = queryset.order_by('pk').values_list('pk', field)
+    last_pk = None
+    sep = u""
+    while True:
+        chunk = qs.filter(pk__gt=last_pk) if last_pk is not None else qs
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        for pk, text in chunk:
+            yield u"{0}<a href='{1}'>{2}</a>".format(sep, url_for(pk), escape(text))
+            sep = u", "
+        last_pk = chunk[-1][0]
+
+
+@register.filter('linked_values_list')
+def linked_values_list(queryset, args):
+    """
+    linked_list for querysets, via iter_linked_list. args is
+    "url_name,field" where field is the link text. i.e.:
+
+        {{ my_objects|linked_values_list:"my_objects_detail,name" }}
+    """
+    url_name, field = args.split(',')
+    return mark_safe(u"".join(iter_linked_list(queryset, url_name.strip(), field.strip())))
+
+
 @register.filter('default_base')
 def default_base(url, url_base):
     """
@@ -59,6 +100,21 @@ def default_base(url, url_base):
     return "{0}{1}".format(url_base, url)
 
 
+# tests string: tuple of prefixes, for startswith
+_prefixes = {}
+MAX_PREFIXES = 1000
+
+
+def split_prefixes(tests):
+    "tests.split(',') as a tuple, cached since templates pass the same literals over and over"
+    prefixes = _prefixes.get(tests)
+    if prefixes is None:
+        if len(_prefixes) >= MAX_PREFIXES:
+            _prefixes.clear()
+        prefixes = _prefixes[tests] = tuple(tests.split(','))
+    return prefixes
+
+
 @register.filter(name="startswith")
 def startswith(value, tests):
     """
@@ -66,7 +122,8 @@ def startswith(value, tests):
 
     i.e. {% if request.path|startswith:'/foo,/bar' %}...
     """
-    return any(value.startswith(i) for i in tests.split(','))
+    # str.startswith takes a tuple and checks them all in one call
+    return value.startswith(split_prefixes(tests))
 
 
 @register.filter(name="active_url_class")
@@ -80,14 +137,32 @@ def active_url_class(request, url_name):
     /tasks/create/', and so on. i.e.:
 
         <div class="{{ request|active_url_class:"tasks_index">Tasks</div>
+
+    url_name can also be several comma separated url names, for nav
+    elements that cover more than one section:
+
+        <div class="{{ request|active_url_class:"tasks_index,projects_index">Work</div>
     """
-    try:
-        url = reverse(url_name)
-    except NoReverseMatch:
-        return ""
-    return " active" if request.path.startswith(url) else ""
+    urls = []
+    for name in split_prefixes(url_name):
+        try:
+            urls.append(cached_reverse(name))
+        except NoReverseMatch:
+            pass
+    return " active" if urls and request.path.startswith(tuple(urls)) else ""
 
 
 @register.filter(name="value_for_key")
 def value_for_key(dct, key):
     return dct.get(key)
+
+
+@register.filter(name="fragment_generation")
+def fragment_generation(fragment_name):
+    """
+    Current generation of a cached fragment family, for use as a
+    {% cache %} vary_on arg. See djunk_drawer.template.get_fragment_generation
+
+        {% cache 600 user_links user.pk "user_links"|fragment_generation %}
+    """
+    return get_fragment_generation(fragment_name)
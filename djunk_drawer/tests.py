@@ -0,0 +1,160 @@
+import os
+import tempfile
+import warnings
+from datetime import datetime
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from djunk_drawer.csv_utils import generate_csv_rows, generate_csv_rows_parallel
+from djunk_drawer.db import (
+    clear_identity_map, get_first_or_none, get_first_or_none_many, start_identity_map)
+from djunk_drawer.money import FixedPointArray, allocate, to_scaled
+from djunk_drawer.template import template_cache_key, warm_template_cache
+from djunk_drawer.utils import make_decimal
+
+
+class GetFirstOrNoneManyTest(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username='user{0}'.format(i),
+                                          email='user{0}@example.com'.format(i))
+                      for i in range(5)]
+
+    def tearDown(self):
+        clear_identity_map()
+
+    def test_one_query_per_batch(self):
+        kwargs_list = [{'username': u.username} for u in self.users] + [{'username': 'nobody'}]
+        with self.assertNumQueries(1):
+            found = get_first_or_none_many(User, kwargs_list)
+        self.assertEqual(found, self.users + [None])
+
+    def test_batch_size(self):
+        with self.assertNumQueries(3):
+            found = get_first_or_none_many(User, [{'pk': u.pk} for u in self.users], batch_size=2)
+        self.assertEqual(found, self.users)
+
+    def test_lookups_one_at_a_time(self):
+        with self.assertNumQueries(2):
+            found = get_first_or_none_many(
+                User, [{'username__startswith': 'user1'}, {'email__startswith': 'user2'}])
+        self.assertEqual(found, self.users[1:3])
+
+    @override_settings(USE_TZ=True)
+    def test_naive_datetime(self):
+        joined = timezone.make_aware(datetime(2015, 1, 1), timezone.get_default_timezone())
+        User.objects.filter(pk=self.users[0].pk).update(date_joined=joined)
+        kwargs_list = [{'date_joined': datetime(2015, 1, 1)}, {'username': 'user1'},
+                       {'username': 'nobody'}]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # naive datetime
+            expected = [get_first_or_none(User, **kwargs) for kwargs in kwargs_list]
+            found = get_first_or_none_many(User, kwargs_list)
+        self.assertEqual(expected, [self.users[0], self.users[1], None])
+        self.assertEqual(found, expected)
+
+    def test_without_identity_map(self):
+        with self.assertNumQueries(2):
+            get_first_or_none(User, username='user1')
+            get_first_or_none(User, username='user1')
+
+    def test_identity_map(self):
+        start_identity_map()
+        with self.assertNumQueries(1):
+            user = get_first_or_none(User, username='user1')
+        with self.assertNumQueries(0):
+            self.assertIs(get_first_or_none(User, username='user1'), user)
+            self.assertIs(get_first_or_none(User, pk=user.pk), user)
+            self.assertEqual(get_first_or_none_many(User, [{'pk': user.pk}]), [user])
+
+    def test_identity_map_many(self):
+        start_identity_map()
+        with self.assertNumQueries(1):
+            found = get_first_or_none_many(User, [{'email': u.email} for u in self.users])
+        with self.assertNumQueries(0):
+            for user in found:
+                self.assertIs(get_first_or_none(User, pk=user.pk), user)
+                self.assertIs(get_first_or_none(User, email=user.email), user)
+
+
+TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'OPTIONS': {'loaders': [('django.template.loaders.locmem.Loader', {
+        'page.html': ('{% load djunk_cache %}'
+                      '{% cache 600 user_links pk %}<{% include "inc.html" %}>{% endcache %}'),
+        'inc.html': 'link {{ pk }}',
+    })]},
+}]
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   TEMPLATES=TEMPLATES)
+class WarmTemplateCacheTest(SimpleTestCase):
+    def test_include(self):
+        keys = warm_template_cache('page.html', 'user_links', [(1, ), (2, )], lambda pk: {'pk': pk})
+        self.assertEqual(keys, [template_cache_key('user_links', 1), template_cache_key('user_links', 2)])
+        self.assertEqual([cache.get(key) for key in keys], ['<link 1>', '<link 2>'])
+
+
+class GenerateCsvRowsParallelTest(SimpleTestCase):
+    def write_csv(self, newline):
+        text = newline.join(['A,B', '1,"two{0}lines"'.format(newline), '3,"""q"""', '5,']) + newline
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(text.encode('utf-8'))
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_universal_newlines(self):
+        # like 'rU': LF, CRLF and CR all end rows, and become LF in quoted fields
+        expected = [('1', 'two\nlines'), ('3', '"q"'), ('5', '')]
+        for newline in ('\n', '\r\n', '\r'):
+            path = self.write_csv(newline)
+            for chunk_bytes in (1, 3, 7, 1000):
+                rows = list(generate_csv_rows_parallel(path, 2, chunk_bytes))
+                self.assertEqual([tuple(row) for row in rows], expected)
+                self.assertEqual(rows, list(generate_csv_rows(path)))
+
+
+class MoneyTest(SimpleTestCase):
+    # half even ties both ways (0.125, 0.135, 2.5), negatives, ints, floats
+    amounts = ['0', '19.99', '-19.99', '0.125', '-0.125', '0.135', '-0.135', '0.25', '-0.35',
+               '2.5', '-3.5', 7, -7, 1.005, Decimal('1E+3')]
+
+    def test_to_scaled(self):
+        for amount in self.amounts:
+            self.assertEqual(Decimal(to_scaled(amount)).scaleb(-2), make_decimal(amount))
+            self.assertEqual(Decimal(to_scaled(amount, 0)), make_decimal(amount, 0))
+
+    def test_multiply(self):
+        amounts = FixedPointArray(self.amounts)
+        for factor in ['0.5', '-0.5', '1.07', '3', '0.005', '-2.5', 2]:
+            self.assertEqual(amounts.multiply(factor).to_decimals(),
+                             [make_decimal(a * Decimal(factor)) for a in amounts])
+
+    def test_round(self):
+        amounts = FixedPointArray(self.amounts, places=3)
+        for places in (0, 1, 2, 3, 4):
+            self.assertEqual(amounts.round(places).to_decimals(),
+                             [make_decimal(a, places) for a in amounts])
+
+    def test_allocate(self):
+        self.assertEqual(allocate('100.00', [1, 1, 1]).to_decimals(),
+                         [Decimal('33.34'), Decimal('33.33'), Decimal('33.33')])
+        self.assertEqual(allocate('-100.00', [1, 1, 1]).to_decimals(),
+                         [Decimal('-33.34'), Decimal('-33.33'), Decimal('-33.33')])
+        for amount in ['100.00', '-100.00', '0.05', '-0.05', '0', '-0.01', '1234.567']:
+            for ratios in ([1, 1, 1], [1, 2], ['0.5', '0.25', '0.25'], [3, 0, 1], [7]):
+                parts = allocate(amount, ratios)
+                self.assertEqual(parts.sum(), make_decimal(amount))
+                self.assertEqual(parts.to_decimals(),
+                                 [-part for part in allocate(-make_decimal(amount), ratios)])
+                total = sum(Decimal(r) for r in ratios)
+                for part, ratio in zip(parts, ratios):
+                    self.assertTrue(abs(part - make_decimal(amount) * Decimal(ratio) / total)
+                                    < Decimal('0.01'))
+        self.assertRaises(ValueError, allocate, '1.00', [0, 0])
@@ -0,0 +1,91 @@
+"""
+Memoized url reversing, for templates that reverse the same url names
+over and over (nav bars, long lists of links to detail views).
+
+Everything is cached per urlconf, script prefix and active language (for
+i18n_patterns), and thrown away when the urlconf's resolver changes (i.e.
+after clear_url_caches()).
+"""
+import numbers
+
+try:
+    from django.urls import NoReverseMatch, get_resolver, get_script_prefix, get_urlconf, reverse
+except ImportError:  # Django < 1.10
+    from django.core.urlresolvers import (
+        NoReverseMatch, get_resolver, get_script_prefix, get_urlconf, reverse)
+from django.utils.translation import get_language
+
+
+# Reversed in place of a pk to find where pks go in a url. Digits only,
+# so it fits both \d+ and [-\w]+ style patterns.
+PK_PLACEHOLDER = 918273645
+
+# (urlconf, script prefix, language, url name, kind): (resolver, result)
+_cache = {}
+
+
+def _cached(url_name, kind, compute):
+    urlconf = get_urlconf()
+    resolver = get_resolver(urlconf)
+    key = (urlconf, get_script_prefix(), get_language(), url_name, kind)
+    cached = _cache.get(key)
+    if cached is None or cached[0] is not resolver:
+        cached = (resolver, compute())
+        _cache[key] = cached
+    return cached[1]
+
+
+def cached_reverse(url_name):
+    "reverse(url_name), memoized. Raises NoReverseMatch just like reverse."
+    def compute():
+        try:
+            return reverse(url_name)
+        except NoReverseMatch:
+            return None
+    url = _cached(url_name, 'noargs', compute)
+    if url is None:
+        raise NoReverseMatch(u"Reverse for '{0}' not found.".format(url_name))
+    return url
+
+
+def url_template(url_name):
+    """
+    A format string like '/things/{0}/' for a url taking a single pk arg,
+    or None if the url can't be reversed that way.
+    """
+    placeholder = str(PK_PLACEHOLDER)
+    try:
+        url = reverse(url_name, args=[PK_PLACEHOLDER])
+    except NoReverseMatch:
+        return None
+    if url.count(placeholder) != 1:
+        return None
+    template = url.replace('{', '{{').replace('}', '}}').replace(placeholder, '{0}')
+    # make sure it's not a coincidence of the pattern
+    try:
+        if reverse(url_name, args=[1]) != template.format(1):
+            return None
+    except NoReverseMatch:
+        return None
+    return template
+
+
+def pk_reverser(url_name):
+    """
+    A function of pk returning reverse(url_name, args=[pk]), for reversing
+    the same url for lots of objects. i.e.:
+
+        url_for = pk_reverser('thing_detail')
+        urls = [url_for(thing.pk) for thing in things]
+
+    The url pattern is resolved once into a format string and integer pks
+    are just substituted in. Other pks go through reverse as usual.
+    """
+    template = _cached(url_name, 'pk', lambda: url_template(url_name))
+
+    def reverse_pk(pk):
+        if (template is not None and isinstance(pk, numbers.Integral)
+                and not isinstance(pk, bool) and pk >= 0):
+            return template.format(pk)
+        return reverse(url_name, args=[pk])
+    return reverse_pk
@@ -3,8 +3,10 @@ Only include python-generic stuff in here.
 
 Django-specific stuff goes in db.py, template.py, etc.
 """
+import threading
+
+from collections import OrderedDict
 from decimal import Decimal
-from itertools import izip
 
 
 def find_key(dct, val):
@@ -12,10 +14,173 @@ def find_key(dct, val):
     Return the key of dictionary for value.
     If multiple matches, only one is returned.
     None for no matches.
+
+    Pass a BiDict to skip inverting the whole dict on every call.
+    """
+    if isinstance(dct, BiDict):
+        return dct.key_for(val)
+    return dict(zip(dct.values(), dct.keys())).get(val, None)
+
+
+class _KeySet(set):
+    "Several keys sharing a value in a BiDict's reverse index"
+
+
+class BiDict(dict):
+    """
+    A dict that keeps a reverse index (value: key(s)) in step with itself
+    as it changes, so looking up keys by value is a dict lookup instead of
+    a scan. Values must be hashable.
+
+        states = BiDict(MN='Minnesota', WI='Wisconsin')
+        states.key_for('Minnesota')   # 'MN'
+        states.keys_for('Iowa')       # []
+
+    Values with a single key (the usual case) store just the key in the
+    index; only values shared by several keys get a set.
     """
-    return dict(izip(dct.values(), dct.keys())).get(val, None)
+    def __init__(self, *args, **kwargs):
+        super(BiDict, self).__init__()
+        self._inverse = {}
+        self.update(*args, **kwargs)
+
+    def _link(self, key, value):
+        keys = self._inverse.get(value, _KeySet)
+        if keys is _KeySet:
+            self._inverse[value] = key
+        elif isinstance(keys, _KeySet):
+            keys.add(key)
+        else:
+            self._inverse[value] = _KeySet((keys, key))
+
+    def _unlink(self, key, value):
+        keys = self._inverse[value]
+        if isinstance(keys, _KeySet):
+            keys.discard(key)
+            if len(keys) == 1:
+                self._inverse[value] = keys.pop()
+        else:
+            del self._inverse[value]
+
+    def key_for(self, value, default=None):
+        "A key for value (any one, if several share it), or default"
+        keys = self._inverse.get(value, _KeySet)
+        if keys is _KeySet:
+            return default
+        if isinstance(keys, _KeySet):
+            return next(iter(keys))
+        return keys
+
+    def keys_for(self, value):
+        "List of every key for value"
+        keys = self._inverse.get(value, _KeySet)
+        if keys is _KeySet:
+            return []
+        if isinstance(keys, _KeySet):
+            return list(keys)
+        return [keys]
+
+    def __setitem__(self, key, value):
+        hash(value)  # unhashable values fail before anything changes
+        if key in self:
+            self._unlink(key, self[key])
+        super(BiDict, self).__setitem__(key, value)
+        self._link(key, value)
+
+    def __delitem__(self, key):
+        self._unlink(key, self[key])
+        super(BiDict, self).__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key in self:
+            self._unlink(key, self[key])
+        return super(BiDict, self).pop(key, *default)
+
+    def popitem(self):
+        key, value = super(BiDict, self).popitem()
+        self._unlink(key, value)
+        return key, value
+
+    def clear(self):
+        super(BiDict, self).clear()
+        self._inverse.clear()
+
+    def copy(self):
+        return BiDict(self)
+
+    # py3.9+'s | and |= would bypass update()
+    def __or__(self, other):
+        result = self.copy()
+        result.update(other)
+        return result
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __reduce__(self):
+        return (BiDict, (dict(self), ))
+
+
+# places: quantizer, for make_decimal
+_quantizers = {}
 
 
 def make_decimal(amount, places=2):
     "Convenience function to create/convert to a decimal with n dec places"
-    return Decimal(amount).quantize(Decimal(10) ** -places)
+    quantizer = _quantizers.get(places)
+    if quantizer is None:
+        quantizer = _quantizers[places] = Decimal(10) ** -places
+    return Decimal(amount).quantize(quantizer)
+
+
+class LRUCache(object):
+    """
+    A small thread-safe cache that holds at most maxsize items, dropping
+    the least recently used one when it's full.
+
+        cache = LRUCache(1000)
+        value = cache.get(key)
+        if value is None:
+            value = expensive(key)
+            cache.set(key, value)
+    """
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                return default
+            self.data[key] = value  # move to the most recently used end
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
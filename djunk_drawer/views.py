@@ -1,20 +1,145 @@
+import hashlib
 import os
-from markdown import markdown
+import threading
+from datetime import datetime
 
 from django.conf import settings
 from django.contrib import messages
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView
 
+from djunk_drawer.template import find_template_path
+from djunk_drawer.utils import LRUCache
+
+
+MARKDOWN_EXTENSIONS = ('smartypants', )
+
+# rendered html, keyed on (path, mtime, extensions)
+_markdown_html = LRUCache(getattr(settings, 'MARKDOWN_CACHE_SIZE', 256))
+_markdown_instances = threading.local()
+
+
+def get_markdown(extensions=MARKDOWN_EXTENSIONS):
+    """
+    A Markdown instance for this set of extensions, built once per thread.
+
+    Markdown instances hold state while converting, so they can be reused
+    (after reset()) but not shared between threads.
+    """
+    extensions = tuple(extensions)
+    instances = getattr(_markdown_instances, 'instances', None)
+    if instances is None:
+        instances = _markdown_instances.instances = {}
+    if extensions not in instances:
+        from markdown import Markdown  # only load markdown if something's rendered
+        instances[extensions] = Markdown(extensions=list(extensions))
+    return instances[extensions].reset()
+
+
+def render_markdown_file(path, extensions=MARKDOWN_EXTENSIONS):
+    """
+    Render the markdown file at path to html, with caching.
+
+    Cached html is keyed on the path, the file's mtime and the extensions,
+    so editing the file invalidates it. Lookups go to an in-process LRU
+    (MARKDOWN_CACHE_SIZE files, default 256) then the default django
+    cache. Raises IOError/OSError if the file is missing.
+    """
+    extensions = tuple(extensions)
+    key = (path, os.path.getmtime(path), extensions)
+    html = _markdown_html.get(key)
+    if html is not None:
+        return html
+
+    cache_key = 'markdown_view.{0}'.format(
+        hashlib.md5(repr(key).encode('utf-8')).hexdigest())
+    html = cache.get(cache_key)
+    if html is None:
+        with open(path, 'r') as f:
+            html = get_markdown(extensions).convert(f.read())
+        cache.set(cache_key, html, getattr(settings, 'MARKDOWN_CACHE_TIMEOUT', None))
+    _markdown_html.set(key, html)
+    return html
+
+
+def prerender_markdown(root=None, extensions=MARKDOWN_EXTENSIONS,
+                       suffixes=('.markdown', '.md')):
+    """
+    Render every markdown file under root (default settings.MARKDOWN_ROOT)
+    into the cache, i.e. at startup or from the prerender_markdown command.
+    Returns the list of paths rendered.
+    """
+    root = root or getattr(settings, 'MARKDOWN_ROOT', None)
+    if not root:
+        raise ImproperlyConfigured('prerender_markdown requires settings.MARKDOWN_ROOT')
+    rendered = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(suffixes):
+                path = os.path.join(dirpath, filename)
+                render_markdown_file(path, extensions)
+                rendered.append(path)
+    return rendered
+
+
+# (view class, template name): (template mtime, content, etag, last modified)
+_rendered_text = {}
+
 
 class TextPlainView(TemplateView):
-    "A base view for serving plain text files via templates"
+    """
+    A base view for serving plain text files via templates
+
+    Set cache_rendered = True if the output doesn't depend on the request.
+    The template is then rendered once (and again whenever its file
+    changes), served with ETag and Last-Modified headers, and conditional
+    GETs are answered with a 304 without rendering anything.
+    """
+    cache_rendered = False
+
     def render_to_response(self, context, **kwargs):
         return super(TextPlainView, self).render_to_response(
             context, content_type='text/plain', **kwargs)
 
+    def get_rendered(self, request, *args, **kwargs):
+        "(content, etag, last_modified) for the template, rendering only if it changed"
+        path = find_template_path(self.template_name)
+        mtime = os.path.getmtime(path) if path else None
+        key = (self.__class__, self.template_name)
+        cached = _rendered_text.get(key)
+        if cached is None or cached[0] != mtime:
+            response = super(TextPlainView, self).get(request, *args, **kwargs)
+            content = response.render().content
+            cached = (
+                mtime,
+                content,
+                hashlib.md5(content).hexdigest(),
+                datetime.utcfromtimestamp(mtime).replace(microsecond=0) if mtime else None,
+                )
+            _rendered_text[key] = cached
+        return cached[1:]
+
+    def get(self, request, *args, **kwargs):
+        if not self.cache_rendered:
+            return super(TextPlainView, self).get(request, *args, **kwargs)
+
+        content, etag, last_modified = self.get_rendered(request, *args, **kwargs)
+
+        @condition(etag_func=lambda request: etag,
+                   last_modified_func=lambda request: last_modified)
+        def respond(request):
+            return HttpResponse(content, content_type='text/plain')
+        return respond(request)
+
 
 class RobotsTxtView(TextPlainView):
+    """
+    Set cache_rendered = True in a subclass (or as_view(cache_rendered=True))
+    if your robots.txt doesn't use the request, i.e. for the host.
+    """
     template_name = 'robots.txt'
 
 
@@ -60,7 +185,8 @@ class MarkdownView(TemplateView):
 
     Set settings.MARKDOWN_ROOT.
 
-    TODO: add caching.
+    Rendered html is cached (see render_markdown_file) until the file
+    changes. Use prerender_markdown to warm the cache ahead of time.
     """
     template_name = 'markdown_view.html'
     mkd_extensions = ['smartypants']
@@ -75,9 +201,8 @@ class MarkdownView(TemplateView):
 
         src = os.path.join(self.mkd_root, self.filename)
         try:
-            with open(src, 'r') as f:
-                context['content'] = markdown(f.read(), extensions=self.mkd_extensions)
-        except IOError:
+            context['content'] = render_markdown_file(src, self.mkd_extensions)
+        except (IOError, OSError):
             context['content'] = 'Missing Markdown file: {0}'.format(self.filename)
 
         return context
@@ -1,10 +1,49 @@
 import floppyforms as forms
 
-from dateutil.parser import parse
+from datetime import datetime
 
-from django.template import Context, loader
+from django.template import Context
 from django.utils import timezone
 
+from djunk_drawer.dates import DATE_FORMAT
+from djunk_drawer.template import get_cached_template
+from djunk_drawer.utils import LRUCache
+
+
+# formats tried with strptime before falling back to dateutil
+FAST_DATE_FORMATS = (DATE_FORMAT, '%Y-%m-%d')
+
+# (date text, time, tz name): localized datetime or None
+_parsed_dates = LRUCache(1000)
+
+
+def parse_date_text(date_text):
+    "date_text as a date, trying FAST_DATE_FORMATS before dateutil's parser"
+    for fmt in FAST_DATE_FORMATS:
+        try:
+            return datetime.strptime(date_text, fmt).date()
+        except ValueError:
+            pass
+    from dateutil.parser import parse  # slow to import, and rarely needed
+    return parse(date_text).date()
+
+
+def make_local_datetime(date_text, time, tz):
+    """
+    date_text at time, localized to tz, or None if it doesn't parse.
+    Cached, since filter forms send the same dates over and over.
+    """
+    key = (date_text, time, getattr(tz, 'zone', None) or repr(tz))
+    value = _parsed_dates.get(key, key)
+    if value is key:
+        try:
+            value = timezone.make_aware(
+                timezone.datetime.combine(parse_date_text(date_text), time), tz)
+        except Exception:
+            value = None  # Just do nothing if invalid data?
+        _parsed_dates.set(key, value)
+    return value
+
 
 class USPhoneNumberMultiWidget(forms.MultiWidget):
     """
@@ -20,11 +59,19 @@ class USPhoneNumberMultiWidget(forms.MultiWidget):
         )
         super(USPhoneNumberMultiWidget, self).__init__(widgets, attrs)
 
-    def render(self, *args, **kwargs):
-        required = self.is_required
-        for widget in self.widgets:
+    # Pass is_required down to the three inputs when it's set (fields set
+    # it on their widget once), rather than on every render
+    _is_required = False
+
+    def _get_is_required(self):
+        return self._is_required
+
+    def _set_is_required(self, required):
+        self._is_required = required
+        for widget in getattr(self, 'widgets', ()):
             widget.is_required = required
-        return super(USPhoneNumberMultiWidget, self).render(*args, **kwargs)
+
+    is_required = property(_get_is_required, _set_is_required)
 
     def decompress(self, value):
         if value:
@@ -70,33 +117,24 @@ class DateRangeWidget(forms.MultiWidget):
         if value is None:
             return (None, None)
         values = []
-        values.append(value[0].strftime('%m/%d/%Y')
+        values.append(value[0].strftime(DATE_FORMAT)
                       if isinstance(value[0], timezone.datetime) else None)
-        values.append(value[1].strftime('%m/%d/%Y')
+        values.append(value[1].strftime(DATE_FORMAT)
                       if isinstance(value[1], timezone.datetime) else None)
         return tuple(values)
 
     def value_from_datadict(self, data={}, files=None, name=None):
         from_date = None
         to_date = None
-
-        def make_datetime(date_text, time=timezone.datetime.min.time()):
-            try:
-                return timezone.make_aware(
-                           timezone.datetime.combine(
-                               parse(date_text), time),
-                           timezone.get_current_timezone()
-                       )
-            except Exception:
-                return None  # Just do nothing if invalid data?
+        tz = timezone.get_current_timezone()
 
         from_text = data.get('{0}_0'.format(name))
         if from_text:
-            from_date = make_datetime(from_text, timezone.datetime.min.time())
+            from_date = make_local_datetime(from_text, timezone.datetime.min.time(), tz)
 
         to_text = data.get('{0}_1'.format(name))
         if to_text:
-            to_date = make_datetime(to_text, timezone.datetime.max.time())
+            to_date = make_local_datetime(to_text, timezone.datetime.max.time(), tz)
 
         return (from_date, to_date)
 
@@ -117,6 +155,9 @@ class DateRangeWidget(forms.MultiWidget):
         Why @staticmethod? Because this is designed for this MultiWidget
         and our TableFilterForm and there's no good place to access
         both the widget instance and the queryset at the same time.
+
+        For wide ranges on big tables, see djunk_drawer.db's
+        date_range_bucket_filters, map_date_range and count_by_period.
         """
         filters = {}
         expire_from, expire_to = dates
@@ -146,6 +187,9 @@ class BetterFileInput(forms.ClearableFileInput):
     def __init__(self, attrs={}, *args, **kwargs):
         super(BetterFileInput, self).__init__(attrs)
 
-    def render(self, name, value, attrs=None):
-        t = loader.get_template(self.template_name)
-        return t.render(Context({'value': value, 'name': name, 'attrs': attrs}))
+    def render(self, name, value, attrs=None, renderer=None):
+        t = get_cached_template(self.template_name)
+        context = {'value': value, 'name': name, 'attrs': attrs}
+        if not hasattr(t, 'template'):  # Django < 1.8 templates want a Context
+            context = Context(context)
+        return t.render(context)